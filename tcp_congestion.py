@@ -3,21 +3,70 @@ TCP 擁塞控制演算法實現
 支持多種擁塞控制演算法：Reno、NewReno、Cubic、BBR
 """
 from abc import ABC, abstractmethod
+from enum import IntEnum
 from typing import Optional, Tuple
 import time
 import math
 
+# math.cbrt 需要 Python 3.11+，舊版退回一般的 1/3 次方
+_cbrt = getattr(math, "cbrt", None) or (lambda x: x ** (1.0 / 3.0))
+
+
+class CongestionState(IntEnum):
+    """擁塞控制狀態"""
+    SLOW_START = 0
+    CONGESTION_AVOIDANCE = 1
+    FAST_RECOVERY = 2
+
+
+class BBRState(IntEnum):
+    """BBR 狀態機狀態"""
+    STARTUP = 0
+    DRAIN = 1
+    PROBE_BW = 2
+    PROBE_RTT = 3
+
+
+# 熱路徑比較用的模組層級常數，避免每個 ACK 都經過 Enum 類別屬性查找
+SLOW_START = CongestionState.SLOW_START
+CONGESTION_AVOIDANCE = CongestionState.CONGESTION_AVOIDANCE
+FAST_RECOVERY = CongestionState.FAST_RECOVERY
+
+BBR_STARTUP = BBRState.STARTUP
+BBR_DRAIN = BBRState.DRAIN
+BBR_PROBE_BW = BBRState.PROBE_BW
+BBR_PROBE_RTT = BBRState.PROBE_RTT
+
+# NewReno 快速恢復期間的 ACK 種類
+ACK_NORMAL = 0
+ACK_PARTIAL = 1  # 部分 ACK：只確認了部分遺失前送出的資料
+ACK_FULL = 2     # 完全 ACK：確認了進入快速恢復前送出的所有資料
+
+# 預先建立的無窮大，避免每次呼叫 float('inf')
+_INF = float('inf')
+
+# 對外顯示用的狀態字串，依 CongestionState 的值索引
+_STATE_NAMES = ("slow_start", "congestion_avoidance", "fast_recovery")
+
 
 class CongestionAlgorithm(ABC):
     """擁塞控制演算法基類"""
     
+    # 每條連接一個實例、每個 ACK 都會存取，使用 __slots__ 取代實例 __dict__
+    __slots__ = ("congestion_window", "ssthresh", "congestion_state", "initial_ssthresh")
+    
     def __init__(self):
         self.congestion_window = 1.0
         self.ssthresh = 16.0
-        self.congestion_state = "slow_start"  # slow_start, congestion_avoidance, fast_recovery
+        self.congestion_state = SLOW_START  # CongestionState
+    
+    @property
+    def state_name(self) -> str:
+        """目前擁塞狀態的字串名稱（slow_start / congestion_avoidance / fast_recovery）"""
+        return _STATE_NAMES[self.congestion_state]
     
     @abstractmethod
-    def on_ack_received(self, acked_bytes: int = 1) -> Tuple[float, float, str]:
+    def on_ack_received(self, acked_bytes: int = 1) -> Tuple[float, float, CongestionState]:
         """
         收到 ACK 時的處理
         返回: (new_cwnd, new_ssthresh, new_state)
@@ -25,7 +74,7 @@ class CongestionAlgorithm(ABC):
         pass
     
     @abstractmethod
-    def on_packet_loss(self, loss_type: str = "timeout") -> Tuple[float, float, str]:
+    def on_packet_loss(self, loss_type: str = "timeout") -> Tuple[float, float, CongestionState]:
         """
         檢測到封包遺失時的處理
         loss_type: "timeout" 或 "fast_retransmit"
@@ -34,131 +83,187 @@ class CongestionAlgorithm(ABC):
         pass
     
     @abstractmethod
-    def on_fast_recovery_exit(self) -> Tuple[float, float, str]:
+    def on_fast_recovery_exit(self) -> Tuple[float, float, CongestionState]:
         """
         退出快速恢復時的處理
         返回: (new_cwnd, new_ssthresh, new_state)
         """
         pass
     
+    def apply_acks(self, n: int) -> Tuple[float, float, CongestionState]:
+        """
+        一次處理 n 個連續的 ACK
+        預設逐一呼叫 on_ack_received，子類別可覆寫成封閉形式的批次更新
+        返回: (new_cwnd, new_ssthresh, new_state)
+        """
+        result = (self.congestion_window, self.ssthresh, self.congestion_state)
+        for _ in range(n):
+            result = self.on_ack_received()
+        return result
+    
+    def _apply_aimd_acks(self, n: int) -> Tuple[float, float, CongestionState]:
+        """Reno 系列（慢啟動 +1、擁塞避免 +1/cwnd）的 n 個 ACK 封閉形式更新"""
+        cwnd = self.congestion_window
+        if self.congestion_state == SLOW_START and n > 0:
+            # 慢啟動：到達 ssthresh 之前每個 ACK 加 1
+            room = max(1, math.ceil(self.ssthresh - cwnd))
+            if n < room:
+                cwnd += n
+                n = 0
+            else:
+                cwnd += room
+                n -= room
+                self.congestion_state = CONGESTION_AVOIDANCE
+        if self.congestion_state == CONGESTION_AVOIDANCE and n > 0:
+            # 擁塞避免：逐 ACK 為 W += 1/W，即 W^2 每次增加 2 + 1/W^2；
+            # 累加 1/W^2 ≈ ln(1 + 2n/W^2) / 2，得 W' = sqrt(W^2 + 2n + ln(1 + 2n/W^2) / 2)，
+            # 與逐一呼叫 on_ack_received 的結果相差在 1e-4 以內（cwnd >= 8 時）
+            w2 = cwnd * cwnd
+            cwnd = math.sqrt(w2 + 2.0 * n + 0.5 * math.log1p(2.0 * n / w2))
+        # fast_recovery 狀態下 ACK 不改變 cwnd
+        self.congestion_window = cwnd
+        return cwnd, self.ssthresh, self.congestion_state
+    
     def reset(self):
         """重置演算法狀態"""
         self.congestion_window = 1.0
         self.ssthresh = 16.0
-        self.congestion_state = "slow_start"
+        self.congestion_state = SLOW_START
         self.initial_ssthresh = 16.0
-        self.ssthresh_lowered = False
 
 
 class RenoAlgorithm(CongestionAlgorithm):
     """TCP Reno 演算法（當前實現）"""
     
+    __slots__ = ("_ssthresh_cap",)
+    
     def __init__(self):
         super().__init__()
         self.initial_ssthresh = 16.0  # 記錄初始 ssthresh
-        self.ssthresh_lowered = False  # 標記 ssthresh 是否已經降低過
+        self._ssthresh_cap = _INF  # ssthresh 的上限，丟包後只能降低
     
-    def on_ack_received(self, acked_bytes: int = 1) -> Tuple[float, float, str]:
+    def on_ack_received(self, acked_bytes: int = 1) -> Tuple[float, float, CongestionState]:
         # Reno: ssthresh 在收到 ACK 時不會改變，一旦降低就不會再上升
-        if self.congestion_state == "slow_start":
+        # 每個 ACK 都會呼叫，先把屬性讀進區域變數，最後只寫回一次
+        cwnd = self.congestion_window
+        state = self.congestion_state
+        if state == SLOW_START:
             # 慢啟動：每收到一個ACK，擁塞視窗增加1個MSS
-            self.congestion_window += 1.0
-            if self.congestion_window >= self.ssthresh:
-                self.congestion_state = "congestion_avoidance"
-        elif self.congestion_state == "congestion_avoidance":
+            cwnd += 1.0
+            if cwnd >= self.ssthresh:
+                state = CONGESTION_AVOIDANCE
+                self.congestion_state = state
+        elif state == CONGESTION_AVOIDANCE:
             # 擁塞避免：每收到一個ACK，擁塞視窗增加1/cwnd
-            self.congestion_window += 1.0 / self.congestion_window
+            cwnd += 1.0 / cwnd
         # fast_recovery 狀態下收到新 ACK 會退出，由 on_fast_recovery_exit 處理
         # 注意：ssthresh 保持不變，不會因為收到 ACK 而增加
-        
-        return self.congestion_window, self.ssthresh, self.congestion_state
+        self.congestion_window = cwnd
+
+        return cwnd, self.ssthresh, state
     
-    def on_packet_loss(self, loss_type: str = "timeout") -> Tuple[float, float, str]:
+    def apply_acks(self, n: int) -> Tuple[float, float, CongestionState]:
+        return self._apply_aimd_acks(n)
+    
+    def on_packet_loss(self, loss_type: str = "timeout") -> Tuple[float, float, CongestionState]:
         # Reno: 丟包時降低 ssthresh，一旦降低就不會再上升（即使後續 cwnd 增長）
         if loss_type == "timeout":
             # 超時：進入慢啟動
-            new_ssthresh = max(2.0, self.congestion_window / 2.0)
+            half = self.congestion_window * 0.5
+            new_ssthresh = half if half > 2.0 else 2.0
             # 確保 ssthresh 只能降低，不能上升（這是 Reno 的特性）
-            if not self.ssthresh_lowered:
-                # 第一次降低 ssthresh
-                self.ssthresh = new_ssthresh
-                self.ssthresh_lowered = True
-            else:
-                # 已經降低過，只能進一步降低，不能上升
-                self.ssthresh = min(self.ssthresh, new_ssthresh)
+            # 上限在第一次丟包前為 inf，之後就是上一次的 ssthresh
+            cap = self._ssthresh_cap
+            self.ssthresh = new_ssthresh if new_ssthresh < cap else cap
+            self._ssthresh_cap = self.ssthresh
             self.congestion_window = 1.0
-            self.congestion_state = "slow_start"
+            self.congestion_state = SLOW_START
         elif loss_type == "fast_retransmit":
             # 快速重傳：進入快速恢復
-            new_ssthresh = max(2.0, self.congestion_window / 2.0)
+            half = self.congestion_window * 0.5
+            new_ssthresh = half if half > 2.0 else 2.0
             # 確保 ssthresh 只能降低，不能上升
-            if not self.ssthresh_lowered:
-                # 第一次降低 ssthresh
-                self.ssthresh = new_ssthresh
-                self.ssthresh_lowered = True
-            else:
-                # 已經降低過，只能進一步降低，不能上升
-                self.ssthresh = min(self.ssthresh, new_ssthresh)
+            cap = self._ssthresh_cap
+            self.ssthresh = new_ssthresh if new_ssthresh < cap else cap
+            self._ssthresh_cap = self.ssthresh
             self.congestion_window = self.ssthresh + 3.0
-            self.congestion_state = "fast_recovery"
+            self.congestion_state = FAST_RECOVERY
         
         return self.congestion_window, self.ssthresh, self.congestion_state
     
-    def on_fast_recovery_exit(self) -> Tuple[float, float, str]:
+    def on_fast_recovery_exit(self) -> Tuple[float, float, CongestionState]:
         # 退出快速恢復：回到擁塞避免
         self.congestion_window = self.ssthresh
-        self.congestion_state = "congestion_avoidance"
+        self.congestion_state = CONGESTION_AVOIDANCE
         return self.congestion_window, self.ssthresh, self.congestion_state
+    
+    def reset(self):
+        super().reset()
+        self._ssthresh_cap = _INF
 
 
 class NewRenoAlgorithm(CongestionAlgorithm):
     """TCP NewReno 演算法（改進的快速恢復）"""
     
+    __slots__ = ("recover",)
+    
     def __init__(self):
         super().__init__()
         self.recover = 0  # 記錄進入快速恢復時的序列號
     
-    def on_ack_received(self, acked_bytes: int = 1, is_partial_ack=False, is_full_ack=False):
-        if self.congestion_state == "slow_start":
+    def on_ack_received(self, acked_bytes: int = 1, ack_kind: int = ACK_NORMAL) -> Tuple[float, float, CongestionState]:
+        """ack_kind: ACK_NORMAL / ACK_PARTIAL / ACK_FULL"""
+        if self.congestion_state == SLOW_START:
             self.congestion_window += 1.0
             if self.congestion_window >= self.ssthresh:
-                self.congestion_state = "congestion_avoidance"
+                self.congestion_state = CONGESTION_AVOIDANCE
 
-        elif self.congestion_state == "congestion_avoidance":
+        elif self.congestion_state == CONGESTION_AVOIDANCE:
             self.congestion_window += 1.0 / self.congestion_window
 
-        elif self.congestion_state == "fast_recovery":
+        elif self.congestion_state == FAST_RECOVERY:
 
-            if is_partial_ack:
+            if ack_kind == ACK_PARTIAL:
                 # 部分 ACK ⇒ 不退出 fast recovery
                 # 重傳下一個封包
                 self.congestion_window += 1.0
-                return self.congestion_window, self.ssthresh, "fast_recovery"
+                return self.congestion_window, self.ssthresh, FAST_RECOVERY
 
-            if is_full_ack:
+            if ack_kind == ACK_FULL:
                 # 完全 ACK ⇒ 退出 fast recovery
                 self.congestion_window = self.ssthresh
-                self.congestion_state = "congestion_avoidance"
+                self.congestion_state = CONGESTION_AVOIDANCE
                 return self.congestion_window, self.ssthresh, self.congestion_state
 
         return self.congestion_window, self.ssthresh, self.congestion_state
+    
+    def apply_acks(self, n: int) -> Tuple[float, float, CongestionState]:
+        # 批次 ACK 皆視為一般 ACK（非 partial / full ACK）
+        return self._apply_aimd_acks(n)
         
-    def on_packet_loss(self, loss_type: str = "timeout") -> Tuple[float, float, str]:
+    def on_packet_loss(self, loss_type: str = "timeout") -> Tuple[float, float, CongestionState]:
         if loss_type == "timeout":
-            self.ssthresh = max(2.0, self.congestion_window / 2.0)
+            half = self.congestion_window * 0.5
+            self.ssthresh = half if half > 2.0 else 2.0
             self.congestion_window = 1.0
-            self.congestion_state = "slow_start"
+            self.congestion_state = SLOW_START
         elif loss_type == "fast_retransmit":
             # NewReno: 改進的快速恢復
-            self.ssthresh = max(2.0, self.congestion_window / 2.0)
-            self.congestion_window = self.ssthresh + 3.0
-            self.congestion_state = "fast_recovery"
+            # cwnd = max(2, cwnd/2) + 3，直接由 half 算出，下限 2 + 3 = 5
+            half = self.congestion_window * 0.5
+            if half > 2.0:
+                self.ssthresh = half
+                self.congestion_window = half + 3.0
+            else:
+                self.ssthresh = 2.0
+                self.congestion_window = 5.0
+            self.congestion_state = FAST_RECOVERY
         
         return self.congestion_window, self.ssthresh, self.congestion_state
     
-    def on_fast_recovery_exit(self) -> Tuple[float, float, str]:
+    def on_fast_recovery_exit(self) -> Tuple[float, float, CongestionState]:
         self.congestion_window = self.ssthresh
-        self.congestion_state = "congestion_avoidance"
+        self.congestion_state = CONGESTION_AVOIDANCE
         return self.congestion_window, self.ssthresh, self.congestion_state
     
     def reset(self):
@@ -169,163 +274,237 @@ class NewRenoAlgorithm(CongestionAlgorithm):
 class CubicAlgorithm(CongestionAlgorithm):
     """TCP Cubic 演算法（非線性增長）"""
     
+    __slots__ = ("c", "beta", "_one_minus_beta_over_c", "w_max", "k", "_k_w_max", "epoch_start_ns",
+                 "_w_cubic_target", "_target_epoch_ns", "_target_interval_ns")
+    
     def __init__(self):
         super().__init__()
         self.c = 0.4  # Cubic 參數
         self.beta = 0.7  # 乘法減半因子
+        self._one_minus_beta_over_c = (1 - self.beta) / self.c  # K 公式中的常數部分
         self.w_max = 0.0  # 進入擁塞避免前的最大 cwnd
         self.k = 0.0  # Cubic 函數的偏移量
-        self.epoch_start = 0.0  # 當前擁塞避免階段的開始時間
+        self._k_w_max = 0.0  # 計算目前 k 時使用的 w_max，未變動就不重算
+        self.epoch_start_ns = 0  # 當前擁塞避免階段的開始時間（monotonic 奈秒）
+        # Cubic 目標值只在每個 RTT 重算一次，其餘 ACK 沿用快取
+        self._w_cubic_target = 0.0
+        self._target_epoch_ns = 0
+        self._target_interval_ns = 100_000_000  # 尚未取得 RTT 時的預設值（100ms）
     
     def _cubic_cwnd(self, t: float) -> float:
         """計算 Cubic 函數的 cwnd 值"""
         if self.w_max <= 0:
             return self.ssthresh
-        return self.c * (t - self.k) ** 3 + self.w_max
+        dt = t - self.k
+        return self.c * dt * dt * dt + self.w_max
     
     def _update_k(self):
-        """更新 k 值"""
+        """更新 k 值（w_max 沒變時沿用上次結果）"""
+        if self.w_max == self._k_w_max:
+            return
+        self._k_w_max = self.w_max
         if self.w_max <= 0:
             self.k = 0
         else:
-            self.k = ((self.w_max * (1 - self.beta)) / self.c) ** (1.0 / 3.0)
+            self.k = _cbrt(self.w_max * self._one_minus_beta_over_c)
     
-    def on_ack_received(self, acked_bytes: int = 1) -> Tuple[float, float, str]:
-        if self.congestion_state == "slow_start":
+    def _start_epoch(self, now_ns: int, from_slow_start: bool = False):
+        """開始新的擁塞避免階段，並讓下一個 ACK 重新計算 Cubic 目標值"""
+        self.epoch_start_ns = now_ns
+        if from_slow_start:
+            # 剛離開慢啟動時 cwnd 就等於 w_max，K 取 0 讓曲線從目前的 cwnd 開始，
+            # 而不是從 w_max * beta 開始
+            self.k = 0.0
+            self._k_w_max = -1.0  # w_max 不會是負值，確保下次 _update_k 會重算
+        else:
+            self._update_k()
+        self._target_epoch_ns = now_ns - self._target_interval_ns
+    
+    def on_ack_received(self, acked_bytes: int = 1, now_ns: Optional[int] = None,
+                        rtt: Optional[float] = None) -> Tuple[float, float, CongestionState]:
+        """
+        now_ns: 呼叫端已取得的 time.monotonic_ns()，批次處理時可共用同一個時間點；
+        未提供時才讀取時鐘
+        rtt: RTT 樣本（秒），用來決定 Cubic 目標值的重算間隔
+        """
+        if rtt is not None and rtt > 0:
+            self._target_interval_ns = int(rtt * 1e9)
+        
+        if self.congestion_state == SLOW_START:
             self.congestion_window += 1.0
             if self.congestion_window >= self.ssthresh:
-                self.congestion_state = "congestion_avoidance"
+                self.congestion_state = CONGESTION_AVOIDANCE
                 self.w_max = self.congestion_window
-                self.epoch_start = time.time()
-                self._update_k()
-        elif self.congestion_state == "congestion_avoidance":
-            # Cubic: 使用立方函數增長
-            t = time.time() - self.epoch_start
-            target = self._cubic_cwnd(t)
+                self._start_epoch(time.monotonic_ns() if now_ns is None else now_ns,
+                                  from_slow_start=True)
+        elif self.congestion_state == CONGESTION_AVOIDANCE:
+            # Cubic: 使用立方函數增長（RFC 8312bis 的 ACK 驅動方式）
+            # 立方函數每個 RTT 才計算一次，之間的 ACK 只朝快取的目標值逼近
+            if now_ns is None:
+                now_ns = time.monotonic_ns()
+            if now_ns - self._target_epoch_ns >= self._target_interval_ns:
+                # 整數 tick 相減後才轉成秒
+                t = (now_ns - self.epoch_start_ns) * 1e-9
+                self._w_cubic_target = self._cubic_cwnd(t)
+                self._target_epoch_ns = now_ns
+            target = self._w_cubic_target
+            cwnd = self.congestion_window
             
             # 在目標值附近時，使用更保守的增長
-            if self.congestion_window < target:
-                # 快速接近目標
-                self.congestion_window = min(target, self.congestion_window + (target - self.congestion_window) / self.congestion_window)
+            if cwnd < target:
+                # 快速接近目標；快速重傳後 cwnd * beta 沒有下限，cwnd < 1 時增量會越過目標，需夾住
+                grown = cwnd + (target - cwnd) / cwnd
+                self.congestion_window = grown if grown < target else target
             else:
                 # 超過目標，緩慢增長
-                self.congestion_window += 0.1 / self.congestion_window
+                self.congestion_window = cwnd + 0.1 / cwnd
         
         return self.congestion_window, self.ssthresh, self.congestion_state
     
-    def on_packet_loss(self, loss_type: str = "timeout") -> Tuple[float, float, str]:
+    def apply_acks(self, n: int) -> Tuple[float, float, CongestionState]:
+        # 同一批 ACK 共用一次時鐘讀取
+        now_ns = time.monotonic_ns()
+        result = (self.congestion_window, self.ssthresh, self.congestion_state)
+        for _ in range(n):
+            result = self.on_ack_received(now_ns=now_ns)
+        return result
+    
+    def on_packet_loss(self, loss_type: str = "timeout") -> Tuple[float, float, CongestionState]:
         if loss_type == "timeout":
             self.w_max = self.congestion_window
-            self.ssthresh = max(2.0, self.congestion_window * self.beta)
+            reduced = self.congestion_window * self.beta
+            self.ssthresh = reduced if reduced > 2.0 else 2.0
             self.congestion_window = 1.0
-            self.congestion_state = "slow_start"
+            self.congestion_state = SLOW_START
         elif loss_type == "fast_retransmit":
             self.w_max = self.congestion_window
-            self.ssthresh = max(2.0, self.congestion_window * self.beta)
-            self.congestion_window = self.congestion_window * self.beta
-            self.congestion_state = "fast_recovery"
-            self.epoch_start = time.time()
-            self._update_k()
+            reduced = self.congestion_window * self.beta
+            self.ssthresh = reduced if reduced > 2.0 else 2.0
+            self.congestion_window = reduced
+            self.congestion_state = FAST_RECOVERY
+            self._start_epoch(time.monotonic_ns())
         
         return self.congestion_window, self.ssthresh, self.congestion_state
     
-    def on_fast_recovery_exit(self) -> Tuple[float, float, str]:
-        self.congestion_state = "congestion_avoidance"
-        self.epoch_start = time.time()
-        self._update_k()
+    def on_fast_recovery_exit(self) -> Tuple[float, float, CongestionState]:
+        self.congestion_state = CONGESTION_AVOIDANCE
+        self._start_epoch(time.monotonic_ns())
         return self.congestion_window, self.ssthresh, self.congestion_state
     
     def reset(self):
         super().reset()
         self.w_max = 0.0
         self.k = 0.0
-        self.epoch_start = 0.0
+        self._k_w_max = 0.0
+        self.epoch_start_ns = 0
+        self._w_cubic_target = 0.0
+        self._target_epoch_ns = 0
 
 
 class BBRAlgorithm(CongestionAlgorithm):
     """TCP BBR (Bottleneck Bandwidth and Round-trip propagation time) 演算法"""
     
+    __slots__ = ("bw_estimate", "rtt_min", "pacing_gain", "cwnd_gain", "bbr_state")
+    
     def __init__(self):
         super().__init__()
         self.bw_estimate = 0.0  # 頻寬估計
-        self.rtt_min = float('inf')  # 最小 RTT
+        self.rtt_min = _INF  # 最小 RTT
         self.pacing_gain = 1.25  # 啟動階段的 pacing gain
         self.cwnd_gain = 2.0  # 啟動階段的 cwnd gain
-        self.bbr_state = "STARTUP"  # STARTUP, DRAIN, PROBE_BW, PROBE_RTT
-        self.rt_prop = 0.0  # Round-trip propagation time
-    
-    def on_ack_received(self, acked_bytes: int = 1, rtt: Optional[float] = None) -> Tuple[float, float, str]:
-        if rtt is not None:
-            # 更新最小 RTT
-            if self.rtt_min == float('inf') or rtt < self.rtt_min:
-                self.rtt_min = rtt
-                self.rt_prop = rtt
-        
-        if self.bbr_state == "STARTUP":
-            # 啟動階段：快速增長
-            self.congestion_window += 1.0
-            # 如果達到目標（頻寬不再增長），進入 DRAIN
-            # 這裡簡化：當 cwnd 達到 ssthresh 時進入 DRAIN
-            if self.congestion_window >= self.ssthresh:
-                self.bbr_state = "DRAIN"
-                self.congestion_state = "congestion_avoidance"
-        elif self.bbr_state == "DRAIN":
-            # 排空階段：減少到目標值
-            if self.congestion_window > self.ssthresh:
-                self.congestion_window = max(self.ssthresh, self.congestion_window - 0.5)
-            else:
-                self.bbr_state = "PROBE_BW"
-        elif self.bbr_state == "PROBE_BW":
-            # 探測頻寬階段：週期性調整
-            # 簡化：緩慢增長
-            self.congestion_window += 0.1 / self.congestion_window
-            self.congestion_state = "congestion_avoidance"
-        elif self.bbr_state == "PROBE_RTT":
-            # 探測 RTT 階段：降低 cwnd
-            if self.congestion_window > 4:
-                self.congestion_window = max(4.0, self.congestion_window - 0.5)
-            else:
-                self.bbr_state = "PROBE_BW"
+        self.bbr_state = BBR_STARTUP  # BBRState
+    
+    @property
+    def rt_prop(self) -> float:
+        """Round-trip propagation time，即目前的最小 RTT"""
+        return self.rtt_min
+    
+    def on_ack_received(self, acked_bytes: int = 1, rtt: Optional[float] = None) -> Tuple[float, float, CongestionState]:
+        # 更新最小 RTT（rtt_min 初始為 inf，第一個樣本必定小於它）
+        if rtt is not None and rtt < self.rtt_min:
+            self.rtt_min = rtt
         
+        # 依 BBR 狀態查表分派，取代 if/elif 比較鏈
+        _BBR_ACK[self.bbr_state](self)
         return self.congestion_window, self.ssthresh, self.congestion_state
     
-    def on_packet_loss(self, loss_type: str = "timeout") -> Tuple[float, float, str]:
+    def on_packet_loss(self, loss_type: str = "timeout") -> Tuple[float, float, CongestionState]:
         # BBR: 對 loss 不敏感，主要依賴頻寬和 RTT 估計
         if loss_type == "timeout":
             # 超時時才降低
-            self.ssthresh = max(2.0, self.congestion_window / 2.0)
-            self.congestion_window = max(4.0, self.congestion_window * 0.5)
+            half = self.congestion_window * 0.5
+            self.ssthresh = half if half > 2.0 else 2.0
+            self.congestion_window = half if half > 4.0 else 4.0
         elif loss_type == "fast_retransmit":
             # 快速重傳時輕微降低
-            self.ssthresh = max(2.0, self.congestion_window * 0.875)
-            self.congestion_window = self.congestion_window * 0.875
+            reduced = self.congestion_window * 0.875
+            self.ssthresh = reduced if reduced > 2.0 else 2.0
+            self.congestion_window = reduced
         
         return self.congestion_window, self.ssthresh, self.congestion_state
     
-    def on_fast_recovery_exit(self) -> Tuple[float, float, str]:
+    def on_fast_recovery_exit(self) -> Tuple[float, float, CongestionState]:
         # BBR 不依賴傳統的快速恢復
-        self.congestion_state = "congestion_avoidance"
+        self.congestion_state = CONGESTION_AVOIDANCE
         return self.congestion_window, self.ssthresh, self.congestion_state
     
     def reset(self):
         super().reset()
         self.bw_estimate = 0.0
-        self.rtt_min = float('inf')
-        self.bbr_state = "STARTUP"
-        self.rt_prop = 0.0
+        self.rtt_min = _INF
+        self.bbr_state = BBR_STARTUP
+
+
+# BBR 各狀態的 ACK 處理，以 BBRState 為索引組成分派表
+def _bbr_startup_ack(bbr: BBRAlgorithm):
+    """啟動階段：快速增長"""
+    bbr.congestion_window += 1.0
+    # 如果達到目標（頻寬不再增長），進入 DRAIN
+    # 這裡簡化：當 cwnd 達到 ssthresh 時進入 DRAIN
+    if bbr.congestion_window >= bbr.ssthresh:
+        bbr.bbr_state = BBR_DRAIN
+        bbr.congestion_state = CONGESTION_AVOIDANCE
+
+
+def _bbr_drain_ack(bbr: BBRAlgorithm):
+    """排空階段：減少到目標值"""
+    if bbr.congestion_window > bbr.ssthresh:
+        bbr.congestion_window = max(bbr.ssthresh, bbr.congestion_window - 0.5)
+    else:
+        bbr.bbr_state = BBR_PROBE_BW
+
+
+def _bbr_probe_bw_ack(bbr: BBRAlgorithm):
+    """探測頻寬階段：週期性調整（簡化：緩慢增長）"""
+    bbr.congestion_window += 0.1 / bbr.congestion_window
+    bbr.congestion_state = CONGESTION_AVOIDANCE
+
+
+def _bbr_probe_rtt_ack(bbr: BBRAlgorithm):
+    """探測 RTT 階段：降低 cwnd"""
+    if bbr.congestion_window > 4:
+        bbr.congestion_window = max(4.0, bbr.congestion_window - 0.5)
+    else:
+        bbr.bbr_state = BBR_PROBE_BW
+
+
+_BBR_ACK = (_bbr_startup_ack, _bbr_drain_ack, _bbr_probe_bw_ack, _bbr_probe_rtt_ack)
+
+
+# 演算法名稱 -> 類別，於模組載入時建立一次
+_ALGOS = {
+    "Reno": RenoAlgorithm,
+    "NewReno": NewRenoAlgorithm,
+    "Cubic": CubicAlgorithm,
+    "BBR": BBRAlgorithm
+}
+_ALGO_NAMES = tuple(_ALGOS)
 
 
 def create_algorithm(algorithm_name: str) -> CongestionAlgorithm:
     """創建指定的擁塞控制演算法"""
-    algorithms = {
-        "Reno": RenoAlgorithm,
-        "NewReno": NewRenoAlgorithm,
-        "Cubic": CubicAlgorithm,
-        "BBR": BBRAlgorithm
-    }
+    cls = _ALGOS.get(algorithm_name)
+    if cls is None:
+        raise ValueError(f"不支持的演算法: {algorithm_name}. 支持的演算法: {list(_ALGO_NAMES)}")
     
-    if algorithm_name not in algorithms:
-        raise ValueError(f"不支持的演算法: {algorithm_name}. 支持的演算法: {list(algorithms.keys())}")
-    
-    return algorithms[algorithm_name]()
-
+    return cls()
@@ -2,83 +2,198 @@
 TCP連接類
 實現TCP連接的狀態管理和協議邏輯
 """
-from enum import Enum
-from typing import Optional, List, Callable
+from enum import IntEnum
+from typing import Optional, List, Callable, Deque, Iterable, Tuple
+from collections import deque
+import os
 import time
 import random
-import hmac
+import heapq
+from math import ldexp
+import itertools
 import hashlib
+import struct
+import functools
 from tcp_packet import TCPPacket, TCPFlag
-from tcp_congestion import CongestionAlgorithm, create_algorithm
+from tcp_congestion import CongestionAlgorithm, CongestionState, create_algorithm, FAST_RECOVERY
 
 
-class TCPState(Enum):
-    """TCP連接狀態"""
-    CLOSED = "CLOSED"
-    LISTEN = "LISTEN"
-    SYN_SENT = "SYN_SENT"
-    SYN_RECEIVED = "SYN_RECEIVED"
-    ESTABLISHED = "ESTABLISHED"
-    FIN_WAIT_1 = "FIN_WAIT_1"
-    FIN_WAIT_2 = "FIN_WAIT_2"
-    CLOSE_WAIT = "CLOSE_WAIT"
-    CLOSING = "CLOSING"
-    LAST_ACK = "LAST_ACK"
-    TIME_WAIT = "TIME_WAIT"
+# 位元測試用的整數標誌位，避免 IntFlag 運算子每次都經過 Enum 機制
+_SYN = int(TCPFlag.SYN)
+_ACK = int(TCPFlag.ACK)
+_FIN = int(TCPFlag.FIN)
+_SYN_ACK = _SYN | _ACK
+_SYN_OR_FIN = _SYN | _FIN
+_PSH_ACK = int(TCPFlag.PSH | TCPFlag.ACK)
+_FIN_ACK = _FIN | _ACK
+
+
+# SYN cookie 的雜湊輸入：client ISN、來源埠、目的埠、時間片
+_COOKIE_MSG = struct.Struct('>IHHI')
+
+@functools.lru_cache(maxsize=4096)
+def _cookie_hash(secret: bytes, client_isn: int, src_port: int, dst_port: int, time_slot: int) -> int:
+    """
+    計算 32-bit SYN cookie，以參數為鍵快取：
+    SYN 重傳與第三步 ACK 驗證通常落在同一時間片，重複計算只需一次字典查詢
+    """
+    # 以 keyed BLAKE2b 取代 HMAC-SHA256：單次壓縮、沒有 HMAC 的內外層 padding，直接輸出 4 bytes
+    msg = _COOKIE_MSG.pack(client_isn & 0xFFFFFFFF, src_port, dst_port, time_slot & 0xFFFFFFFF)
+    digest = hashlib.blake2b(msg, digest_size=4, key=secret).digest()
+    return int.from_bytes(digest, 'big')
+
+
+def _rtt_estimate(srtt: Optional[float], rttvar: Optional[float],
+                  samples: Iterable[float]) -> Tuple[Optional[float], Optional[float]]:
+    """
+    依 RFC 6298 以一串 RTT 樣本依序更新 (SRTT, RTTVAR)，全程只用區域變數
+    RTTVAR <- (1-beta)*RTTVAR + beta*|SRTT - R'|，SRTT <- (1-alpha)*SRTT + alpha*R'（alpha=1/8, beta=1/4）
+    另加 Linux tcp_rtt_estimator 的阻尼：樣本低於 SRTT - RTTVAR（RTT 明顯下降）時，
+    偏差只以 1/32 計入 RTTVAR，避免 RTT 變小反而把 RTO 撐大
+    """
+    for sample_rtt in samples:
+        if sample_rtt <= 0:
+            continue
+        if srtt is None:
+            # 初次測量
+            srtt = sample_rtt
+            rttvar = sample_rtt / 2
+        else:
+            err = sample_rtt - srtt
+            if err < -rttvar:
+                rttvar = 0.96875 * rttvar + 0.03125 * -err
+            else:
+                rttvar = 0.75 * rttvar + 0.25 * abs(err)
+            srtt = 0.875 * srtt + 0.125 * sample_rtt
+    return srtt, rttvar
+
+
+# 初始序列號取自預先讀取的 os.urandom 緩衝，每 128 個 ISN 才需要一次系統呼叫；
+# 需要以 random.seed 重現模擬時，將 USE_URANDOM_ISN 設為 False 改用 random.randint
+USE_URANDOM_ISN = True
+_isn_buf = b''
+_isn_pos = 0
+
+
+def _next_isn() -> int:
+    """產生 1000-9999 之間的初始序列號"""
+    global _isn_buf, _isn_pos
+    if not USE_URANDOM_ISN:
+        return random.randint(1000, 9999)
+    if _isn_pos >= len(_isn_buf):
+        _isn_buf = os.urandom(256)
+        _isn_pos = 0
+    value = int.from_bytes(_isn_buf[_isn_pos:_isn_pos + 2], 'little')
+    _isn_pos += 2
+    return 1000 + value % 9000
+
+
+class TCPState(IntEnum):
+    """TCP連接狀態（整數值，狀態機比較走整數比較；顯示用 .name）"""
+    CLOSED = 0
+    LISTEN = 1
+    SYN_SENT = 2
+    SYN_RECEIVED = 3
+    ESTABLISHED = 4
+    FIN_WAIT_1 = 5
+    FIN_WAIT_2 = 6
+    CLOSE_WAIT = 7
+    CLOSING = 8
+    LAST_ACK = 9
+    TIME_WAIT = 10
+
+
+class _UnackedEntry:
+    """未確認的資料包或握手控制包（發送時間、重傳計數、基準RTO）"""
+    
+    __slots__ = ("packet", "send_time", "retransmit_count", "base_rto",
+                 "end_seq", "kind", "cookie", "deadline")
+    
+    def __init__(self, packet: Optional[TCPPacket], send_time: float, base_rto: float,
+                 kind: str = "data", cookie: Optional[int] = None):
+        self.packet = packet
+        self.send_time = send_time
+        self.retransmit_count = 0
+        self.base_rto = base_rto
+        self.end_seq = 0  # 被確認時應超過的序號，僅資料包使用
+        self.kind = kind  # "data" / "syn" / "syn_ack"
+        self.deadline: Optional[float] = None  # 目前排程的超時時間，None 表示不在超時堆中
+        self.cookie = cookie  # SYN-ACK 帶的 SYN cookie
 
 
 class TCPConnection:
     """TCP連接"""
     
+    __slots__ = ("local_port", "remote_port", "is_server",
+                 "seq_num", "ack_num", "remote_seq_num", "remote_ack_num",
+                 "state", "send_window", "receive_window",
+                 "congestion_alg", "_cwnd_int",
+                 "send_buffer", "receive_buffer", "min_pacing_interval", "last_paced_send_time",
+                 "unacked_packets", "_unacked_counter", "_entry_pool", "_timeout_heap",
+                 "handshake_unacked",
+                 "cookie_secret", "cookie_time_step",
+                 "rto", "handshake_rto", "srtt", "rttvar", "last_ack_num", "dup_ack_count",
+                 "on_state_change", "on_packet_sent", "on_packet_received",
+                 "on_metric_change", "on_retransmit_needed",
+                 "packets_sent", "packets_received", "bytes_sent", "bytes_received",
+                 "retransmissions", "duplicate_acks",
+                 "_last_emitted_cwnd", "_last_emitted_ssthresh")
+    
     def __init__(self, local_port: int, remote_port: int, is_server: bool = False, 
                  congestion_algorithm: str = "Reno"):
-        self.local_port = local_port
-        self.remote_port = remote_port
-        self.is_server = is_server
+        self.local_port: int = local_port
+        self.remote_port: int = remote_port
+        self.is_server: bool = is_server
         
         # 序列號和確認號
-        self.seq_num = random.randint(1000, 9999) if not is_server else 0
-        self.ack_num = 0
-        self.remote_seq_num = 0
-        self.remote_ack_num = 0
+        self.seq_num: int = _next_isn() if not is_server else 0
+        self.ack_num: int = 0
+        self.remote_seq_num: int = 0
+        self.remote_ack_num: int = 0
         
         # 狀態
-        self.state = TCPState.LISTEN if is_server else TCPState.CLOSED
+        self.state: TCPState = TCPState.LISTEN if is_server else TCPState.CLOSED
         
         # 視窗大小
-        self.send_window = 65535
-        self.receive_window = 65535
+        self.send_window: int = 65535
+        self.receive_window: int = 65535
         
         # 擁塞控制演算法
+        # cwnd / ssthresh / 擁塞狀態只存在演算法物件上，連接透過同名屬性讀取
         self.congestion_alg: CongestionAlgorithm = create_algorithm(congestion_algorithm)
-        self.congestion_window = self.congestion_alg.congestion_window
-        self.ssthresh = self.congestion_alg.ssthresh
-        self.congestion_state = self.congestion_alg.congestion_state
+        self._cwnd_int: int = int(self.congestion_alg.congestion_window)  # 可同時在途的封包數，cwnd 改變時才重算
         
         # 資料緩衝區
-        self.send_buffer: List[bytes] = []
-        self.receive_buffer: List[bytes] = []
+        self.send_buffer: Deque[bytes] = deque()
+        self.receive_buffer: Deque[bytes] = deque()
         # pacing 相關
-        self.min_pacing_interval = 0.05  # 最小發送間隔（秒）
-        self.last_paced_send_time = 0.0
+        self.min_pacing_interval: float = 0.05  # 最小發送間隔（秒）
+        self.last_paced_send_time: float = 0.0
         
         # 未確認的資料包（包含發送時間、重傳計數、基準RTO）
-        # {'packet': TCPPacket, 'send_time': float, 'retransmit_count': int, 'base_rto': float}
-        self.unacked_packets: List[dict] = []
+        # 新資料包的序號遞增、只從尾端加入，因此佇列天然依 seq_num 排序，最早的未確認包永遠在 [0]
+        self.unacked_packets: Deque[_UnackedEntry] = deque()
+        # 超時堆中 deadline 相同時決定順序，避免比較到條目物件
+        self._unacked_counter = itertools.count()
+        # 已確認條目的回收池，送出新資料包時優先重用，減少物件配置
+        self._entry_pool: Deque[_UnackedEntry] = deque(maxlen=256)
+        # 資料包的超時堆 (deadline, 計數器, _UnackedEntry)，check_timeouts 只需查看堆頂
+        # 條目被確認或重新排程時不從堆中刪除，取出時比對 entry.deadline 略過過期記錄
+        self._timeout_heap: List[tuple] = []
         # 三次握手未確認的控制包（SYN / SYN-ACK）
-        self.handshake_unacked: List[dict] = []  # {'packet': TCPPacket, 'send_time': float, 'retransmit_count': int, 'type': str}
+        self.handshake_unacked: List[_UnackedEntry] = []
         # SYN cookie 用於抗半開與亂序握手
-        self.cookie_secret = random.getrandbits(64)
+        self.cookie_secret: bytes = os.urandom(16)  # blake2b 金鑰
         self.cookie_time_step = 64  # 秒為單位的時間片
         
         # 重傳相關參數
         # RFC 6298 初值
-        self.rto = 3.0  # 動態 RTO（秒）
-        self.handshake_rto = 3.0  # 三次握手初始 RTO
+        self.rto: float = 3.0  # 動態 RTO（秒）
+        self.handshake_rto: float = 3.0  # 三次握手初始 RTO
         self.srtt: Optional[float] = None  # 平滑 RTT
         self.rttvar: Optional[float] = None  # RTT 變異
-        self.duplicate_ack_count = {}  # {ack_num: count} 用於快速重傳
-        self.last_ack_num = 0  # 最後收到的ACK號
+        self.last_ack_num: int = 0  # 最後收到的ACK號
+        self.dup_ack_count: int = 0  # last_ack_num 的重複次數，用於快速重傳
         
         # 回調函數
         self.on_state_change: Optional[Callable] = None
@@ -86,16 +201,42 @@ class TCPConnection:
         self.on_packet_received: Optional[Callable] = None
         self.on_metric_change: Optional[Callable] = None  # 新增：數值變化回調
         self.on_retransmit_needed: Optional[Callable] = None  # 新增：需要重傳時的回調
-        
-        # 統計資訊
-        self.stats = {
-            'packets_sent': 0,
-            'packets_received': 0,
-            'bytes_sent': 0,
-            'bytes_received': 0,
-            'retransmissions': 0,
-            'duplicate_acks': 0
-        }
+        # 上次透過 on_metric_change 回報的 cwnd/ssthresh，用於略過未變化的回報
+        self._last_emitted_cwnd: Optional[float] = None
+        self._last_emitted_ssthresh: Optional[float] = None
+        
+        # 統計資訊（每個封包都會累加，直接存成屬性；get_stats 時才組成 dict）
+        self.packets_sent: int = 0
+        self.packets_received: int = 0
+        self.bytes_sent: int = 0
+        self.bytes_received: int = 0
+        self.retransmissions: int = 0
+        self.duplicate_acks: int = 0
+    
+    @property
+    def congestion_window(self) -> float:
+        return self.congestion_alg.congestion_window
+    
+    @congestion_window.setter
+    def congestion_window(self, value: float):
+        self.congestion_alg.congestion_window = value
+        self._cwnd_int = int(value)
+    
+    @property
+    def ssthresh(self) -> float:
+        return self.congestion_alg.ssthresh
+    
+    @ssthresh.setter
+    def ssthresh(self, value: float):
+        self.congestion_alg.ssthresh = value
+    
+    @property
+    def congestion_state(self) -> CongestionState:
+        return self.congestion_alg.congestion_state
+    
+    @congestion_state.setter
+    def congestion_state(self, value: CongestionState):
+        self.congestion_alg.congestion_state = value
     
     def set_state(self, new_state: TCPState):
         """設置連接狀態"""
@@ -107,12 +248,17 @@ class TCPConnection:
             
             # 當連接建立時，記錄初始擁塞控制指標
             if new_state == TCPState.ESTABLISHED and self.on_metric_change:
-                # 同步演算法狀態
-                self.congestion_window = self.congestion_alg.congestion_window
-                self.ssthresh = self.congestion_alg.ssthresh
-                self.congestion_state = self.congestion_alg.congestion_state
-                self.on_metric_change("cwnd", self.congestion_window, time.time())
-                self.on_metric_change("ssthresh", self.ssthresh, time.time())
+                self._emit_window_metrics(time.time())
+    
+    def _emit_window_metrics(self, now: float):
+        """以單一 "cc" 回調回報 (cwnd, ssthresh)，兩者都與上次回報相同時略過"""
+        alg = self.congestion_alg
+        cwnd = alg.congestion_window
+        ssthresh = alg.ssthresh
+        if cwnd != self._last_emitted_cwnd or ssthresh != self._last_emitted_ssthresh:
+            self._last_emitted_cwnd = cwnd
+            self._last_emitted_ssthresh = ssthresh
+            self.on_metric_change("cc", (cwnd, ssthresh), now)
     
     def send_packet(self, packet: TCPPacket, is_retransmit: bool = False) -> TCPPacket:
         """發送資料包"""
@@ -121,10 +267,10 @@ class TCPConnection:
         packet.window_size = self.receive_window
         
         if is_retransmit:
-            self.stats['retransmissions'] += 1
+            self.retransmissions += 1
         
-        self.stats['packets_sent'] += 1
-        self.stats['bytes_sent'] += packet.get_size()
+        self.packets_sent += 1
+        self.bytes_sent += packet.size
         
         if self.on_packet_sent:
             self.on_packet_sent(packet)
@@ -134,17 +280,16 @@ class TCPConnection:
     # ---------------------
     # SYN Cookie Helpers
     # ---------------------
-    def _cookie_time_slot(self) -> int:
-        return int(time.time() // self.cookie_time_step)
+    def _cookie_time_slot(self, now: Optional[float] = None) -> int:
+        if now is None:
+            now = time.time()
+        return int(now // self.cookie_time_step)
     
     def _generate_syn_cookie(self, client_isn: int, src_port: int, dst_port: int, time_slot: Optional[int] = None) -> int:
         """生成 SYN cookie（32-bit）"""
         if time_slot is None:
             time_slot = self._cookie_time_slot()
-        msg = f"{client_isn}:{src_port}:{dst_port}:{time_slot}".encode()
-        digest = hmac.new(self.cookie_secret.to_bytes(8, 'big'), msg, hashlib.sha256).digest()
-        # 取前4 bytes 作為 32-bit cookie
-        return int.from_bytes(digest[:4], 'big')
+        return _cookie_hash(self.cookie_secret, client_isn, src_port, dst_port, time_slot)
     
     def _validate_syn_cookie(self, cookie: int, client_isn: int, src_port: int, dst_port: int) -> bool:
         """驗證 SYN cookie，允許當前或前一個時間片"""
@@ -159,8 +304,8 @@ class TCPConnection:
         if packet.dest_port != self.local_port:
             return None
         
-        self.stats['packets_received'] += 1
-        self.stats['bytes_received'] += packet.get_size()
+        self.packets_received += 1
+        self.bytes_received += packet.size
         
         if self.on_packet_received:
             self.on_packet_received(packet)
@@ -170,153 +315,178 @@ class TCPConnection:
     
     def _process_packet(self, packet: TCPPacket) -> Optional[TCPPacket]:
         """處理接收到的資料包"""
-        response = None
+        # 標誌位只讀一次，之後都是區域變數的真值測試
+        flags = packet.flags
+        is_syn = flags & _SYN
+        is_ack = flags & _ACK
+        is_fin = flags & _FIN
+        data_len = len(packet.data)
         
         # 更新遠程序列號和確認號
-        if packet.has_flag(TCPFlag.SYN) or len(packet.data) > 0:
+        if is_syn or data_len > 0:
             self.remote_seq_num = packet.seq_num
-        if packet.has_flag(TCPFlag.ACK):
+        if is_ack:
             self.remote_ack_num = packet.ack_num
         
-        # 狀態機處理
-        if self.state == TCPState.LISTEN:
-            if packet.has_flag(TCPFlag.SYN):
-                # 伺服器收到SYN，使用 SYN cookie 回應 SYN-ACK
-                client_isn = packet.seq_num
-                cookie = self._generate_syn_cookie(client_isn, packet.source_port, packet.dest_port)
-                self.seq_num = cookie  # 將cookie放在自己的ISN
-                self.ack_num = client_isn + 1
-                self.remote_seq_num = client_isn
-                response = self._create_packet(TCPFlag.SYN | TCPFlag.ACK)
-                self.set_state(TCPState.SYN_RECEIVED)
-                # 記錄握手未確認的 SYN-ACK，帶上 cookie
-                self.handshake_unacked = [{
-                    'packet': response,
-                    'send_time': time.time(),
-                    'retransmit_count': 0,
-                    'type': 'syn_ack',
-                    'cookie': cookie,
-                    'base_rto': self.handshake_rto
-                }]
-        
-        elif self.state == TCPState.SYN_SENT:
-            if packet.has_flag(TCPFlag.SYN) and packet.has_flag(TCPFlag.ACK):
-                # 客戶端收到SYN-ACK，發送ACK
-                self.ack_num = packet.seq_num + 1
-                self.remote_seq_num = packet.seq_num
-                response = self._create_packet(TCPFlag.ACK)
-                # 收到 SYN-ACK 後，握手確認完成，清除未確認列表
+        # 狀態機處理：依目前狀態查表分派（CLOSE_WAIT 等待應用層關閉，無需處理）
+        handler = _RX_HANDLERS.get(self.state)
+        if handler is None:
+            return None
+        return handler(self, packet, is_syn, is_ack, is_fin, data_len)
+    
+    def _rx_listen(self, packet: TCPPacket, is_syn: int, is_ack: int, is_fin: int,
+                   data_len: int) -> Optional[TCPPacket]:
+        """LISTEN 狀態下處理接收到的資料包"""
+        response = None
+        if is_syn:
+            # 伺服器收到SYN，使用 SYN cookie 回應 SYN-ACK
+            client_isn = packet.seq_num
+            now = time.time()
+            cookie = self._generate_syn_cookie(client_isn, packet.source_port, packet.dest_port,
+                                               self._cookie_time_slot(now))
+            self.seq_num = cookie  # 將cookie放在自己的ISN
+            self.ack_num = client_isn + 1
+            self.remote_seq_num = client_isn
+            response = self._create_packet(_SYN_ACK, now=now)
+            self.set_state(TCPState.SYN_RECEIVED)
+            # 記錄握手未確認的 SYN-ACK，帶上 cookie
+            self.handshake_unacked = [
+                _UnackedEntry(response, now, self.handshake_rto, 'syn_ack', cookie)]
+        return response
+    
+    def _rx_syn_sent(self, packet: TCPPacket, is_syn: int, is_ack: int, is_fin: int,
+                     data_len: int) -> Optional[TCPPacket]:
+        """SYN_SENT 狀態下處理接收到的資料包"""
+        response = None
+        if is_syn and is_ack:
+            # 客戶端收到SYN-ACK，發送ACK
+            self.ack_num = packet.seq_num + 1
+            self.remote_seq_num = packet.seq_num
+            response = self._create_ack()
+            # 收到 SYN-ACK 後，握手確認完成，清除未確認列表
+            self.handshake_unacked.clear()
+            self.set_state(TCPState.ESTABLISHED)
+        elif is_syn:
+            # 同時打開
+            response = self._create_packet(_SYN_ACK)
+            self.set_state(TCPState.SYN_RECEIVED)
+        return response
+    
+    def _rx_syn_received(self, packet: TCPPacket, is_syn: int, is_ack: int, is_fin: int,
+                         data_len: int) -> Optional[TCPPacket]:
+        """SYN_RECEIVED 狀態下處理接收到的資料包"""
+        response = None
+        if is_ack:
+            # 收到最終 ACK，握手完成
+            ack_cookie = packet.ack_num - 1
+            client_isn = self.remote_seq_num
+            if self._validate_syn_cookie(ack_cookie, client_isn, packet.source_port, packet.dest_port):
                 self.handshake_unacked.clear()
                 self.set_state(TCPState.ESTABLISHED)
-            elif packet.has_flag(TCPFlag.SYN):
-                # 同時打開
-                response = self._create_packet(TCPFlag.SYN | TCPFlag.ACK)
-                self.set_state(TCPState.SYN_RECEIVED)
-        
-        elif self.state == TCPState.SYN_RECEIVED:
-            if packet.has_flag(TCPFlag.ACK):
-                # 收到最終 ACK，握手完成
-                ack_cookie = packet.ack_num - 1
-                client_isn = self.remote_seq_num
-                if self._validate_syn_cookie(ack_cookie, client_isn, packet.source_port, packet.dest_port):
-                    self.handshake_unacked.clear()
-                    self.set_state(TCPState.ESTABLISHED)
-                else:
-                    # cookie 驗證失敗，忽略
-                    return None
-            elif packet.has_flag(TCPFlag.SYN):
-                # 客戶端重傳 SYN（可能因為 SYN/ACK 丟失）
-                # 重新回傳 SYN-ACK，並刷新握手未確認列表
-                client_isn = packet.seq_num
-                cookie = self._generate_syn_cookie(client_isn, packet.source_port, packet.dest_port)
-                self.seq_num = cookie
-                self.ack_num = client_isn + 1
-                self.remote_seq_num = client_isn
-                response = self._create_packet(TCPFlag.SYN | TCPFlag.ACK)
-                # 找到已記錄的 syn_ack 未確認包並更新發送時間與計數
-                if self.handshake_unacked:
-                    syn_ack_entry = self.handshake_unacked[0]
-                    syn_ack_entry['packet'] = response
-                    syn_ack_entry['send_time'] = time.time()
-                    syn_ack_entry['retransmit_count'] += 1
-                    syn_ack_entry['cookie'] = cookie
-                    syn_ack_entry.setdefault('base_rto', self.handshake_rto)
-                else:
-                    self.handshake_unacked = [{
-                        'packet': response,
-                        'send_time': time.time(),
-                        'retransmit_count': 0,
-                        'type': 'syn_ack',
-                        'cookie': cookie,
-                        'base_rto': self.handshake_rto
-                    }]
-                # 標記為重傳以計入統計
-                response = self.send_packet(response, is_retransmit=True)
-        
-        elif self.state == TCPState.ESTABLISHED:
-            # 若伺服端重傳 SYN/ACK（例如第三步 ACK 丟失），客戶端要回 ACK
-            if packet.has_flag(TCPFlag.SYN) and packet.has_flag(TCPFlag.ACK):
-                # 更新對端序號，回應 ACK，並保持已建立狀態
-                self.ack_num = packet.seq_num + 1
-                self.remote_seq_num = packet.seq_num
-                response = self._create_packet(TCPFlag.ACK)
-                # 不改變 state（保持 ESTABLISHED）
-            
-            # 處理ACK確認（用於擁塞控制和重傳）- 先處理，因為這可能觸發發送緩衝區中的數據或重傳
-            if packet.has_flag(TCPFlag.ACK):
-                # 處理所有ACK（包括重複ACK）
-                # 注意：即使ACK號碼沒有增加，也要處理（可能是重複ACK）
-                ack_response = self.handle_ack(packet.ack_num)
-                # handle_ack現在通過回調機制處理快速重傳，不直接返回重傳包
-                # 如果返回了包，那是從緩衝區發送的新包
-                if ack_response:
-                    response = ack_response
-            
-            if packet.has_flag(TCPFlag.FIN):
-                # 收到FIN，進入CLOSE_WAIT
-                self.ack_num = packet.seq_num + 1
-                response = self._create_packet(TCPFlag.ACK)
-                self.set_state(TCPState.CLOSE_WAIT)
-            elif len(packet.data) > 0:
-                # 接收資料
-                self.receive_buffer.append(packet.data)
-                self.ack_num = packet.seq_num + len(packet.data)
-                # 只有在沒有其他響應時才創建ACK響應
-                if not response:
-                    response = self._create_packet(TCPFlag.ACK)
-        
-        elif self.state == TCPState.FIN_WAIT_1:
-            if packet.has_flag(TCPFlag.ACK):
-                self.set_state(TCPState.FIN_WAIT_2)
-            elif packet.has_flag(TCPFlag.FIN):
-                self.ack_num = packet.seq_num + 1
-                response = self._create_packet(TCPFlag.ACK)
-                self.set_state(TCPState.CLOSING)
-        
-        elif self.state == TCPState.FIN_WAIT_2:
-            if packet.has_flag(TCPFlag.FIN):
-                self.ack_num = packet.seq_num + 1
-                response = self._create_packet(TCPFlag.ACK)
-                self.set_state(TCPState.TIME_WAIT)
-        
-        elif self.state == TCPState.CLOSE_WAIT:
-            # 等待應用層關閉
-            pass
-        
-        elif self.state == TCPState.CLOSING:
-            if packet.has_flag(TCPFlag.ACK):
-                self.set_state(TCPState.TIME_WAIT)
-        
-        elif self.state == TCPState.LAST_ACK:
-            if packet.has_flag(TCPFlag.ACK):
-                self.set_state(TCPState.CLOSED)
-        
+            else:
+                # cookie 驗證失敗，忽略
+                return None
+        elif is_syn:
+            # 客戶端重傳 SYN（可能因為 SYN/ACK 丟失）
+            # 重新回傳 SYN-ACK，並刷新握手未確認列表
+            client_isn = packet.seq_num
+            now = time.time()
+            cookie = self._generate_syn_cookie(client_isn, packet.source_port, packet.dest_port,
+                                               self._cookie_time_slot(now))
+            self.seq_num = cookie
+            self.ack_num = client_isn + 1
+            self.remote_seq_num = client_isn
+            response = self._create_packet(_SYN_ACK, now=now)
+            # 找到已記錄的 syn_ack 未確認包並更新發送時間與計數
+            if self.handshake_unacked:
+                syn_ack_entry = self.handshake_unacked[0]
+                syn_ack_entry.packet = response
+                syn_ack_entry.send_time = now
+                syn_ack_entry.retransmit_count += 1
+                syn_ack_entry.cookie = cookie
+            else:
+                self.handshake_unacked = [
+                    _UnackedEntry(response, now, self.handshake_rto, 'syn_ack', cookie)]
+            # 標記為重傳以計入統計
+            response = self.send_packet(response, is_retransmit=True)
         return response
     
-    def _create_packet(self, flags, data: bytes = b'') -> TCPPacket:
-        """創建TCP資料包"""
-        # 確保flags是整數類型
-        flags_int = int(flags) if not isinstance(flags, int) else flags
+    def _rx_established(self, packet: TCPPacket, is_syn: int, is_ack: int, is_fin: int,
+                        data_len: int) -> Optional[TCPPacket]:
+        """ESTABLISHED 狀態下處理接收到的資料包"""
+        response = None
+        # 若伺服端重傳 SYN/ACK（例如第三步 ACK 丟失），客戶端要回 ACK
+        if is_syn and is_ack:
+            # 更新對端序號，回應 ACK，並保持已建立狀態
+            self.ack_num = packet.seq_num + 1
+            self.remote_seq_num = packet.seq_num
+            response = self._create_ack()
+            # 不改變 state（保持 ESTABLISHED）
+        
+        # 處理ACK確認（用於擁塞控制和重傳）- 先處理，因為這可能觸發發送緩衝區中的數據或重傳
+        if is_ack:
+            # 處理所有ACK（包括重複ACK）
+            # 注意：即使ACK號碼沒有增加，也要處理（可能是重複ACK）
+            ack_response = self.handle_ack(packet.ack_num)
+            # handle_ack現在通過回調機制處理快速重傳，不直接返回重傳包
+            # 如果返回了包，那是從緩衝區發送的新包
+            if ack_response:
+                response = ack_response
+        
+        if is_fin:
+            # 收到FIN，進入CLOSE_WAIT
+            self.ack_num = packet.seq_num + 1
+            response = self._create_ack()
+            self.set_state(TCPState.CLOSE_WAIT)
+        elif data_len > 0:
+            # 接收資料
+            self.receive_buffer.append(packet.data)
+            self.ack_num = packet.seq_num + data_len
+            # 只有在沒有其他響應時才創建ACK響應
+            if not response:
+                response = self._create_ack()
+        return response
+    
+    def _rx_fin_wait_1(self, packet: TCPPacket, is_syn: int, is_ack: int, is_fin: int,
+                       data_len: int) -> Optional[TCPPacket]:
+        """FIN_WAIT_1 狀態下處理接收到的資料包"""
+        response = None
+        if is_ack:
+            self.set_state(TCPState.FIN_WAIT_2)
+        elif is_fin:
+            self.ack_num = packet.seq_num + 1
+            response = self._create_ack()
+            self.set_state(TCPState.CLOSING)
+        return response
+    
+    def _rx_fin_wait_2(self, packet: TCPPacket, is_syn: int, is_ack: int, is_fin: int,
+                       data_len: int) -> Optional[TCPPacket]:
+        """FIN_WAIT_2 狀態下處理接收到的資料包"""
+        response = None
+        if is_fin:
+            self.ack_num = packet.seq_num + 1
+            response = self._create_ack()
+            self.set_state(TCPState.TIME_WAIT)
+        return response
+    
+    def _rx_closing(self, packet: TCPPacket, is_syn: int, is_ack: int, is_fin: int,
+                    data_len: int) -> Optional[TCPPacket]:
+        """CLOSING 狀態下處理接收到的資料包"""
+        if is_ack:
+            self.set_state(TCPState.TIME_WAIT)
+        return None
+    
+    def _rx_last_ack(self, packet: TCPPacket, is_syn: int, is_ack: int, is_fin: int,
+                     data_len: int) -> Optional[TCPPacket]:
+        """LAST_ACK 狀態下處理接收到的資料包"""
+        if is_ack:
+            self.set_state(TCPState.CLOSED)
+        return None
+    
+    def _create_packet(self, flags: int, data: bytes = b'', now: Optional[float] = None) -> TCPPacket:
+        """創建TCP資料包（呼叫端已讀過時鐘時傳入 now，資料包不再自行讀取）"""
+        # 確保flags是純整數（TCPFlag 組合也轉成 int，之後的位元測試不經過 Enum 運算子）
+        flags_int = flags if type(flags) is int else int(flags)
         packet = TCPPacket(
             source_port=self.local_port,
             dest_port=self.remote_port,
@@ -324,21 +494,27 @@ class TCPConnection:
             ack_num=self.ack_num,
             flags=flags_int,
             window_size=self.receive_window,
-            data=data
+            data=data,
+            timestamp=now or 0.0
         )
         
         # 更新序列號
-        if packet.has_flag(TCPFlag.SYN) or packet.has_flag(TCPFlag.FIN):
+        if flags_int & _SYN_OR_FIN:
             self.seq_num += 1
         elif len(data) > 0:
             self.seq_num += len(data)
         
         return packet
 
+    def _create_ack(self) -> TCPPacket:
+        """創建純 ACK（最常見的控制包）：不帶資料、不佔序號，略過 _create_packet 的旗標轉換與序號更新"""
+        return TCPPacket(self.local_port, self.remote_port, self.seq_num, self.ack_num,
+                         _ACK, self.receive_window)
+
     def _packet_end_seq(self, packet: TCPPacket) -> int:
         """計算封包被確認時應超過的序號（含 SYN/FIN 佔用一個序號）"""
         length = len(packet.data)
-        if packet.has_flag(TCPFlag.SYN) or packet.has_flag(TCPFlag.FIN):
+        if packet.flags & _SYN_OR_FIN:
             length += 1
         return packet.seq_num + length
     
@@ -346,118 +522,125 @@ class TCPConnection:
         """發起連接（客戶端）"""
         # 允許從 CLOSED 或 SYN_SENT 狀態重新連接（如果之前的連接失敗）
         if self.state not in [TCPState.CLOSED, TCPState.SYN_SENT]:
-            raise Exception(f"Cannot connect from state {self.state}")
+            raise Exception(f"Cannot connect from state {self.state.name}")
         
         # 如果已經在 SYN_SENT 狀態，重置為 CLOSED 再連接
         if self.state == TCPState.SYN_SENT:
             self.set_state(TCPState.CLOSED)
         
-        self.seq_num = random.randint(1000, 9999)
-        packet = self._create_packet(TCPFlag.SYN)
+        self.seq_num = _next_isn()
+        now = time.time()
+        packet = self._create_packet(_SYN, now=now)
         self.set_state(TCPState.SYN_SENT)
         sent = self.send_packet(packet)
         # 記錄握手未確認的 SYN
-        self.handshake_unacked = [{
-            'packet': sent,
-            'send_time': time.time(),
-            'retransmit_count': 0,
-            'type': 'syn',
-            'base_rto': self.handshake_rto
-        }]
+        self.handshake_unacked = [_UnackedEntry(sent, now, self.handshake_rto, 'syn')]
         return sent
     
-    def send_data(self, data: bytes) -> Optional[TCPPacket]:
-        """發送資料"""
+    def send_data(self, data: bytes, now: Optional[float] = None) -> Optional[TCPPacket]:
+        """發送資料（now 為呼叫端已讀取的時間，未提供時讀取一次時鐘）"""
         if self.state != TCPState.ESTABLISHED:
             return None
         
         # 檢查擁塞視窗
-        if len(self.unacked_packets) >= int(self.congestion_window):
+        if len(self.unacked_packets) >= self._cwnd_int:
             self.send_buffer.append(data)
             return None
         
-        packet = self._create_packet(TCPFlag.PSH | TCPFlag.ACK, data)
+        if now is None:
+            now = time.time()
+        packet = self._create_packet(_PSH_ACK, data, now)
         # 記錄發送時間和重傳計數
-        self.unacked_packets.append({
-            'packet': packet,
-            'send_time': time.time(),
-            'retransmit_count': 0,
-            'base_rto': self.rto,
-            'first_send_time': time.time()
-        })
+        self._push_unacked(packet, now)
         
         # 記錄發送時的擁塞視窗狀態
         if self.on_metric_change:
-            self.on_metric_change("cwnd", self.congestion_window, time.time())
-            self.on_metric_change("ssthresh", self.ssthresh, time.time())
+            self._emit_window_metrics(now)
         
         return self.send_packet(packet)
 
+    def _push_unacked(self, packet: TCPPacket, send_time: float):
+        """將剛送出的資料包加入未確認堆，end_seq 在此算一次供之後每個 ACK 比較"""
+        if self._entry_pool:
+            # 重用回收的條目，覆寫全部欄位
+            entry = self._entry_pool.pop()
+            entry.packet = packet
+            entry.send_time = send_time
+            entry.retransmit_count = 0
+            entry.base_rto = self.rto
+        else:
+            entry = _UnackedEntry(packet, send_time, self.rto)
+        entry.end_seq = self._packet_end_seq(packet)
+        self.unacked_packets.append(entry)
+        self._schedule_timeout(entry)
+    
+    def _schedule_timeout(self, entry: _UnackedEntry):
+        """依 send_time 與指數回退後的 RTO（最多 60 秒）計算截止時間，推入超時堆"""
+        # ldexp(x, n) = x * 2**n，直接調整浮點指數，不經過整數冪與乘法
+        timeout = ldexp(entry.base_rto, entry.retransmit_count)
+        if timeout > 60.0:
+            timeout = 60.0
+        deadline = entry.send_time + timeout
+        entry.deadline = deadline
+        heapq.heappush(self._timeout_heap, (deadline, next(self._unacked_counter), entry))
+
     # RFC 6298 RTO 更新
-    def _update_rto(self, sample_rtt: float):
-        if sample_rtt <= 0:
+    def _update_rto(self, samples: Iterable[float]):
+        """以同一個 ACK 收集到的 RTT 樣本更新 RTO，屬性只讀寫一次"""
+        srtt, rttvar = _rtt_estimate(self.srtt, self.rttvar, samples)
+        if srtt is None:
             return
-        if self.srtt is None:
-            # 初次測量
-            self.srtt = sample_rtt
-            self.rttvar = sample_rtt / 2
-        else:
-            # 依 RFC6298: RTTVAR <- (1-beta)*RTTVAR + beta*|SRTT - R'|
-            # SRTT   <- (1-alpha)*SRTT   + alpha*R'
-            alpha = 1/8
-            beta = 1/4
-            self.rttvar = (1 - beta) * self.rttvar + beta * abs(self.srtt - sample_rtt)
-            self.srtt = (1 - alpha) * self.srtt + alpha * sample_rtt
+        self.srtt = srtt
+        self.rttvar = rttvar
         # RTO = SRTT + max(1, 4*RTTVAR)
-        if self.srtt is not None and self.rttvar is not None:
-            self.rto = self.srtt + max(1.0, 4 * self.rttvar)
+        self.rto = srtt + max(1.0, 4 * rttvar)
     
     def close(self) -> Optional[TCPPacket]:
         """關閉連接"""
         if self.state == TCPState.ESTABLISHED:
-            packet = self._create_packet(TCPFlag.FIN | TCPFlag.ACK)
+            packet = self._create_packet(_FIN_ACK)
             self.set_state(TCPState.FIN_WAIT_1)
             return self.send_packet(packet)
         elif self.state == TCPState.CLOSE_WAIT:
-            packet = self._create_packet(TCPFlag.FIN | TCPFlag.ACK)
+            packet = self._create_packet(_FIN_ACK)
             self.set_state(TCPState.LAST_ACK)
             return self.send_packet(packet)
         return None
     
-    def handle_ack(self, ack_num: int):
+    def handle_ack(self, ack_num: int) -> Optional[TCPPacket]:
         """處理ACK確認"""
+        now = time.time()
         # 檢查是否為重複ACK（用於快速重傳）
         # 注意：重複ACK是指ACK號碼沒有增加，但收到了新的ACK包
         is_duplicate = (ack_num == self.last_ack_num and self.last_ack_num > 0)
         
         if is_duplicate:
             # 重複ACK
-            self.duplicate_ack_count[ack_num] = self.duplicate_ack_count.get(ack_num, 0) + 1
-            self.stats['duplicate_acks'] += 1
+            # 重複ACK的號碼必定等於 last_ack_num，只需一個計數器
+            self.dup_ack_count += 1
+            self.duplicate_acks += 1
             
             # 快速重傳：收到3個重複ACK時立即重傳最早的未確認包
-            if self.duplicate_ack_count[ack_num] == 3 and self.unacked_packets:
-                earliest_unacked = min(self.unacked_packets, key=lambda x: x['packet'].seq_num)
-                packet = earliest_unacked['packet']
+            if self.dup_ack_count == 3 and self.unacked_packets:
+                # 佇列頭即為 seq_num 最小的未確認包
+                earliest_unacked = self.unacked_packets[0]
+                packet = earliest_unacked.packet
                 
                 # 重傳這個包並更新送出時間/計數
-                earliest_unacked['retransmit_count'] += 1
-                earliest_unacked['send_time'] = time.time()
+                earliest_unacked.retransmit_count += 1
+                earliest_unacked.send_time = now
+                self._schedule_timeout(earliest_unacked)
                 if self.on_metric_change:
-                    self.on_metric_change("fast_retx_event", packet.seq_num, time.time())
+                    self.on_metric_change("fast_retx_event", packet.seq_num, now)
                 # 重置重複ACK計數
-                self.duplicate_ack_count[ack_num] = 0
+                self.dup_ack_count = 0
                 # 使用演算法處理快速重傳
-                self.congestion_window, self.ssthresh, self.congestion_state = \
-                    self.congestion_alg.on_packet_loss("fast_retransmit")
-                # 同步演算法狀態
-                self.congestion_alg.congestion_window = self.congestion_window
-                self.congestion_alg.ssthresh = self.ssthresh
-                self.congestion_alg.congestion_state = self.congestion_state
+                alg = self.congestion_alg
+                alg.on_packet_loss("fast_retransmit")
+                self._cwnd_int = int(alg.congestion_window)
                 
                 if self.on_metric_change:
-                    self.on_metric_change("cwnd", self.congestion_window, time.time())
-                    self.on_metric_change("ssthresh", self.ssthresh, time.time())
+                    self._emit_window_metrics(now)
                 
                 # 通過回調通知需要重傳並實際送出
                 if self.on_retransmit_needed:
@@ -468,56 +651,53 @@ class TCPConnection:
         else:
             # 新的ACK（ACK號碼增加了），清除重複ACK計數
             if ack_num > self.last_ack_num:
-                self.duplicate_ack_count.clear()
+                self.dup_ack_count = 0
                 self.last_ack_num = ack_num
             elif self.last_ack_num == 0:
                 # 第一次收到ACK，設置last_ack_num
                 self.last_ack_num = ack_num
         
         # 移除已確認的資料包，並估計 RTT 用於動態 RTO
+        # 資料包序號區間不重疊、end_seq 隨位置遞增，已確認的必定是佇列前端的一段，
+        # 從前端逐一取出即可，成本只和被確認的數量 k 成正比（O(k)）
         old_unacked_count = len(self.unacked_packets)
-        remained = []
-        for p in self.unacked_packets:
-            if self._packet_end_seq(p['packet']) > ack_num:
-                remained.append(p)
-            else:
-                # 被確認，計算 RTT（只用首次發送時間）
-                if 'first_send_time' in p:
-                    sample_rtt = time.time() - p['first_send_time']
-                    self._update_rto(sample_rtt)
-        self.unacked_packets = remained
-        
-        # 記錄舊的擁塞視窗值
-        old_cwnd = self.congestion_window
+        unacked = self.unacked_packets
+        samples = []
+        while unacked and unacked[0].end_seq <= ack_num:
+            p = unacked.popleft()
+            # 被確認，計算 RTT；依 Karn 演算法，重傳過的包無法分辨 ACK 對應哪一次發送，不取樣
+            if p.retransmit_count == 0:
+                samples.append(now - p.send_time)
+            # 放回回收池；資料包本身仍被歷史記錄引用，只釋放條目對它的參照
+            p.packet = None
+            p.deadline = None
+            self._entry_pool.append(p)
+        if samples:
+            self._update_rto(samples)
         
         # 擁塞控制：每收到一個ACK，擁塞視窗增長
         # 只有在有未確認的資料包被確認時才增長
         if len(self.unacked_packets) < old_unacked_count:
             # 有資料包被確認了
             # 如果是快速恢復狀態且收到新ACK，先退出快速恢復
-            if self.congestion_state == "fast_recovery":
-                self.congestion_window, self.ssthresh, self.congestion_state = \
-                    self.congestion_alg.on_fast_recovery_exit()
+            # 演算法就地更新自身狀態，連接只需重算整數視窗
+            alg = self.congestion_alg
+            if alg.congestion_state == FAST_RECOVERY:
+                alg.on_fast_recovery_exit()
             else:
                 # 使用演算法處理ACK
-                self.congestion_window, self.ssthresh, self.congestion_state = \
-                    self.congestion_alg.on_ack_received()
-            
-            # 同步演算法狀態
-            self.congestion_alg.congestion_window = self.congestion_window
-            self.congestion_alg.ssthresh = self.ssthresh
-            self.congestion_alg.congestion_state = self.congestion_state
+                alg.on_ack_received()
+            self._cwnd_int = int(alg.congestion_window)
         
-        # 記錄當前值（每次ACK都記錄，以便圖表顯示完整過程）
+        # 記錄當前值（值有變化才會真正觸發回調）
         if self.on_metric_change:
-            self.on_metric_change("cwnd", self.congestion_window, time.time())
-            self.on_metric_change("ssthresh", self.ssthresh, time.time())
+            self._emit_window_metrics(now)
         
         # 發送緩衝區中的資料（可以發送多個，直到達到擁塞視窗限制）
         response_packet = None
-        while self.send_buffer and len(self.unacked_packets) < int(self.congestion_window):
-            data = self.send_buffer.pop(0)
-            packet = self.send_data(data)
+        while self.send_buffer and len(self.unacked_packets) < self._cwnd_int:
+            data = self.send_buffer.popleft()
+            packet = self.send_data(data, now)
             if packet:
                 response_packet = packet  # 返回最後一個發送的包
             else:
@@ -532,7 +712,7 @@ class TCPConnection:
         """
         to_send: List[TCPPacket] = []
         now = time.time()
-        available_window = int(self.congestion_window) - len(self.unacked_packets)
+        available_window = self._cwnd_int - len(self.unacked_packets)
         if available_window <= 0:
             return to_send
         # pacing：控制發送節奏
@@ -540,92 +720,128 @@ class TCPConnection:
             return to_send
         # 每次只發送最多 available_window 個，逐個 pacing
         while self.send_buffer and available_window > 0:
-            data = self.send_buffer.pop(0)
-            packet = self._create_packet(TCPFlag.PSH | TCPFlag.ACK, data)
-            self.unacked_packets.append({
-                'packet': packet,
-                'send_time': now,
-                'retransmit_count': 0,
-                'base_rto': self.rto,
-                'first_send_time': now
-            })
+            data = self.send_buffer.popleft()
+            packet = self._create_packet(_PSH_ACK, data, now)
+            self._push_unacked(packet, now)
             to_send.append(packet)
             self.last_paced_send_time = now
             available_window -= 1
         # 記錄當下 cwnd/ssthresh 以供圖表
         if to_send and self.on_metric_change:
-            self.on_metric_change("cwnd", self.congestion_window, time.time())
-            self.on_metric_change("ssthresh", self.ssthresh, time.time())
+            self._emit_window_metrics(now)
         return to_send
     
-    def check_timeouts(self):
+    def next_timer_time(self) -> Optional[float]:
+        """
+        下一次需要呼叫 check_timeouts / drain_send_buffer 的時間（time.time() 基準），沒有待辦時為 None
+        超時堆頂可能是已失效的記錄，此時回傳的時間偏早，呼叫端只會多檢查一次
+        """
+        times = []
+        if self._timeout_heap:
+            times.append(self._timeout_heap[0][0])
+        for unacked in self.handshake_unacked:
+            timeout = ldexp(unacked.base_rto, unacked.retransmit_count)
+            if timeout > 60.0:
+                timeout = 60.0
+            times.append(unacked.send_time + timeout)
+        # 緩衝區有資料且視窗有空間時，下一次 pacing 發送的時間
+        if self.send_buffer and len(self.unacked_packets) < self._cwnd_int:
+            times.append(self.last_paced_send_time + self.min_pacing_interval)
+        return min(times) if times else None
+    
+    def check_timeouts(self) -> List[dict]:
         """檢查超時並重傳"""
         current_time = time.time()
         retransmit_packets = []
 
         # 1) 處理握手控制封包（SYN / SYN-ACK）
         for unacked in self.handshake_unacked:
-            packet = unacked['packet']
+            packet = unacked.packet
             # 指數回退 RTO，最多 60 秒
-            timeout = min(60.0, unacked.get('base_rto', self.handshake_rto) * (2 ** unacked['retransmit_count']))
-            if current_time - unacked['send_time'] > timeout:
-                unacked['retransmit_count'] += 1
-                unacked['send_time'] = current_time
+            timeout = ldexp(unacked.base_rto, unacked.retransmit_count)
+            if timeout > 60.0:
+                timeout = 60.0
+            if current_time - unacked.send_time > timeout:
+                unacked.retransmit_count += 1
+                unacked.send_time = current_time
                 # 更新統計並標記為重傳
                 resent = self.send_packet(packet, is_retransmit=True)
                 retransmit_packets.append({
                     'packet': resent,
                     'dest': self.remote_port,  # 用於 simulator 決定轉發
                     'send_time': current_time,
-                    'type': unacked.get('type', 'syn_ack')
+                    'type': unacked.kind
                 })
                 if self.on_metric_change:
-                    self.on_metric_change("rto_event", packet.seq_num, time.time())
+                    self.on_metric_change("rto_event", packet.seq_num, current_time)
 
-        # 2) 處理已建立連線的資料封包
-        for unacked in self.unacked_packets:
-            packet = unacked['packet']
-            timeout = min(60.0, unacked.get('base_rto', self.rto) * (2 ** unacked['retransmit_count']))
-            elapsed = current_time - unacked['send_time']
+        # 2) 處理已建立連線的資料封包：只取出截止時間已過的條目
+        timeout_heap = self._timeout_heap
+        while timeout_heap and timeout_heap[0][0] < current_time:
+            deadline, _, unacked = heapq.heappop(timeout_heap)
+            # 條目已被確認或已重新排程時，堆中的這筆是過期記錄
+            if unacked.deadline != deadline:
+                continue
+            packet = unacked.packet
             
-            # 如果超過重傳超時時間，需要重傳
-            if elapsed > timeout:
-                unacked['retransmit_count'] += 1
-                unacked['send_time'] = current_time
-                
-                # 使用演算法處理超時
-                self.congestion_window, self.ssthresh, self.congestion_state = \
-                    self.congestion_alg.on_packet_loss("timeout")
-                # 同步演算法狀態
-                self.congestion_alg.congestion_window = self.congestion_window
-                self.congestion_alg.ssthresh = self.ssthresh
-                self.congestion_alg.congestion_state = self.congestion_state
-                
-                if self.on_metric_change:
-                    self.on_metric_change("cwnd", self.congestion_window, time.time())
-                    self.on_metric_change("ssthresh", self.ssthresh, time.time())
-                
-                # 更新統計並標記為重傳
-                resent = self.send_packet(packet, is_retransmit=True)
-                retransmit_packets.append({
-                    'packet': resent,
-                    'dest': self.remote_port,  # simulator 透過連接 port 判斷方向
-                    'send_time': current_time,
-                    'type': 'data'
-                })
-                # 重傳視為新的首次發送點，用於後續 RTT 估計
-                unacked['first_send_time'] = current_time
-                if self.on_metric_change:
-                    self.on_metric_change("rto_event", packet.seq_num, time.time())
+            # 超過重傳超時時間，需要重傳
+            unacked.retransmit_count += 1
+            unacked.send_time = current_time
+            
+            # 使用演算法處理超時
+            alg = self.congestion_alg
+            alg.on_packet_loss("timeout")
+            self._cwnd_int = int(alg.congestion_window)
+            
+            if self.on_metric_change:
+                self._emit_window_metrics(current_time)
+            
+            # 更新統計並標記為重傳
+            resent = self.send_packet(packet, is_retransmit=True)
+            retransmit_packets.append({
+                'packet': resent,
+                'dest': self.remote_port,  # simulator 透過連接 port 判斷方向
+                'send_time': current_time,
+                'type': 'data'
+            })
+            # 以退避後的 RTO 重新排程
+            self._schedule_timeout(unacked)
+            if self.on_metric_change:
+                self.on_metric_change("rto_event", packet.seq_num, current_time)
 
         return retransmit_packets
     
+    @property
+    def stats(self) -> dict:
+        """封包計數器（唯讀快照）"""
+        return {
+            'packets_sent': self.packets_sent,
+            'packets_received': self.packets_received,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'retransmissions': self.retransmissions,
+            'duplicate_acks': self.duplicate_acks
+        }
+    
     def get_stats(self) -> dict:
-        """獲取統計資訊"""
+        """獲取統計資訊（stats 的計數器加上目前狀態與視窗）"""
         return {
             **self.stats,
-            'state': self.state.value,
+            'state': self.state.name,
             'congestion_window': self.congestion_window,
             'send_window': self.send_window,
             'receive_window': self.receive_window
-        }
\ No newline at end of file
+        }
+
+
+# 各狀態的接收處理函式，_process_packet 以目前狀態查表
+_RX_HANDLERS = {
+    TCPState.LISTEN: TCPConnection._rx_listen,
+    TCPState.SYN_SENT: TCPConnection._rx_syn_sent,
+    TCPState.SYN_RECEIVED: TCPConnection._rx_syn_received,
+    TCPState.ESTABLISHED: TCPConnection._rx_established,
+    TCPState.FIN_WAIT_1: TCPConnection._rx_fin_wait_1,
+    TCPState.FIN_WAIT_2: TCPConnection._rx_fin_wait_2,
+    TCPState.CLOSING: TCPConnection._rx_closing,
+    TCPState.LAST_ACK: TCPConnection._rx_last_ack,
+}
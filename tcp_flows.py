@@ -0,0 +1,185 @@
+"""
+多流擁塞控制批次模擬
+以 NumPy 結構化陣列保存 N 條流的擁塞控制狀態，一次呼叫處理所有流的事件，
+取代逐流、逐 ACK 的 Python 方法呼叫（支援 Reno、NewReno、Cubic）
+狀態以 float32 保存，與 tcp_congestion 各演算法（float64）的結果只差 float32 捨入：
+Reno/NewReno 經 300 個隨機事件後 cwnd 相差約 1e-5 以內（相對誤差約 4e-7），並非逐位元相同
+Cubic 為逐 ACK 重算目標值的版本：CubicAlgorithm 每個 RTT 才重算一次目標值，
+流記錄中沒有對應的快取欄位，兩者的 cwnd 會有明顯差距（相同事件序列下可達數個百分點）
+"""
+import time
+from typing import Optional
+import numpy as np
+from tcp_congestion import SLOW_START, CONGESTION_AVOIDANCE, FAST_RECOVERY
+
+
+# 每條流的狀態欄位：cwnd 用 float32（整數部分可精確到 2^23，小數增量 1/cwnd 會有捨入誤差），
+# 整條流壓縮成 32 bytes，兩條流剛好一個 cache line
+FLOW_DTYPE = np.dtype([
+    ('cwnd', 'f4'),
+    ('ssthresh', 'f4'),
+    ('wmax', 'f4'),       # Cubic: 上次丟包時的 cwnd
+    ('k', 'f4'),          # Cubic: 立方函數偏移量
+    ('epoch_ns', 'i8'),   # Cubic: 擁塞避免階段開始時間（monotonic 奈秒）
+    ('sscap', 'f4'),      # Reno: ssthresh 只降不升的上限（尚未降低過為 inf）
+    ('state', 'i1'),      # CongestionState
+    ('algo', 'i1'),       # ALGO_IDS
+    ('_pad', 'i2'),
+])
+assert FLOW_DTYPE.itemsize == 32
+
+ALGO_RENO = 0
+ALGO_NEWRENO = 1
+ALGO_CUBIC = 2
+ALGO_IDS = {"Reno": ALGO_RENO, "NewReno": ALGO_NEWRENO, "Cubic": ALGO_CUBIC}
+
+# 事件代碼（每條流每次 step 一個事件）
+EVENT_NONE = 0
+EVENT_ACK = 1
+EVENT_TIMEOUT = 2
+EVENT_FAST_RETRANSMIT = 3
+EVENT_RECOVERY_EXIT = 4
+
+# Cubic 參數（C、beta 取與 CubicAlgorithm 預設值一樣的數值）
+_CUBIC_C = 0.4
+_CUBIC_BETA = 0.7
+
+
+def create_flows(n: int, algorithm_name: str = "Reno") -> np.ndarray:
+    """建立 n 條使用指定演算法、處於初始狀態的流"""
+    if algorithm_name not in ALGO_IDS:
+        raise ValueError(f"不支持批次模擬的演算法: {algorithm_name}. 支持的演算法: {list(ALGO_IDS)}")
+    flows = np.zeros(n, dtype=FLOW_DTYPE)
+    flows['cwnd'] = 1.0
+    flows['ssthresh'] = 16.0
+    flows['state'] = SLOW_START
+    flows['algo'] = ALGO_IDS[algorithm_name]
+    flows['sscap'] = np.inf
+    return flows
+
+
+def _cubic_k(wmax: np.ndarray) -> np.ndarray:
+    """Cubic 的 K = cbrt(w_max * (1 - beta) / C)，w_max <= 0 時為 0"""
+    return np.where(wmax > 0, np.cbrt(wmax * (1 - _CUBIC_BETA) / _CUBIC_C), 0.0)
+
+
+def step_flows(flows: np.ndarray, events: np.ndarray, now_ns: Optional[int] = None):
+    """
+    對所有流各套用一個事件（原地更新 flows）
+    events: 與 flows 等長的事件代碼陣列（EVENT_*）
+    now_ns: 本次 step 共用的 time.monotonic_ns()，未提供時讀取一次時鐘
+    """
+    if now_ns is None:
+        now_ns = time.monotonic_ns()
+
+    cwnd = flows['cwnd']
+    ssthresh = flows['ssthresh']
+    state = flows['state']
+    algo = flows['algo']
+    is_cubic = algo == ALGO_CUBIC
+    is_reno = algo == ALGO_RENO
+
+    # 各遮罩都依更新前的狀態計算，每條流只會落在其中一個
+    ack = events == EVENT_ACK
+    ack_ss = ack & (state == SLOW_START)
+    ack_ca = ack & (state == CONGESTION_AVOIDANCE)
+    timeout = events == EVENT_TIMEOUT
+    fast_rtx = events == EVENT_FAST_RETRANSMIT
+    fr_exit = events == EVENT_RECOVERY_EXIT
+
+    # --- ACK：慢啟動 ---
+    cwnd[ack_ss] += 1.0
+    leave_ss = ack_ss & (cwnd >= ssthresh)
+    state[leave_ss] = CONGESTION_AVOIDANCE
+    # Cubic 離開慢啟動：w_max 取目前 cwnd、K 取 0，曲線從目前的 cwnd 開始
+    cubic_ss_exit = leave_ss & is_cubic
+    flows['wmax'][cubic_ss_exit] = cwnd[cubic_ss_exit]
+    flows['epoch_ns'][cubic_ss_exit] = now_ns
+    flows['k'][cubic_ss_exit] = 0.0
+
+    # --- ACK：擁塞避免 ---
+    aimd_ca = ack_ca & ~is_cubic
+    cwnd[aimd_ca] += 1.0 / cwnd[aimd_ca]
+    cubic_ca = ack_ca & is_cubic
+    if cubic_ca.any():
+        w = cwnd[cubic_ca]
+        wmax = flows['wmax'][cubic_ca]
+        dt = (now_ns - flows['epoch_ns'][cubic_ca]) * 1e-9 - flows['k'][cubic_ca]
+        target = np.where(wmax > 0, _CUBIC_C * dt * dt * dt + wmax, ssthresh[cubic_ca])
+        # 每個 ACK 都依目前時間重算目標值（不做每 RTT 一次的快取）；
+        # cwnd < 1 時增量可能越過目標，夾在目標值
+        cwnd[cubic_ca] = np.where(w < target, np.minimum(w + (target - w) / w, target), w + 0.1 / w)
+
+    # --- 丟包：計算新的 ssthresh ---
+    loss = timeout | fast_rtx
+    cubic_loss = loss & is_cubic
+    flows['wmax'][cubic_loss] = cwnd[cubic_loss]
+    factor = np.where(is_cubic, _CUBIC_BETA, 0.5)
+    reduced = cwnd * factor
+    new_ssthresh = np.maximum(reduced, 2.0)
+    # Reno: ssthresh 一旦降低就只能再降低
+    reno_loss = loss & is_reno
+    new_ssthresh[reno_loss] = np.minimum(new_ssthresh[reno_loss], flows['sscap'][reno_loss])
+    flows['sscap'][reno_loss] = new_ssthresh[reno_loss]
+    ssthresh[loss] = new_ssthresh[loss]
+
+    # --- 超時：回到慢啟動 ---
+    cwnd[timeout] = 1.0
+    state[timeout] = SLOW_START
+
+    # --- 快速重傳：進入快速恢復 ---
+    cwnd[fast_rtx] = np.where(is_cubic, reduced, ssthresh + 3.0)[fast_rtx]
+    state[fast_rtx] = FAST_RECOVERY
+    cubic_epoch = fast_rtx & is_cubic
+
+    # --- 退出快速恢復 ---
+    aimd_exit = fr_exit & ~is_cubic
+    cwnd[aimd_exit] = ssthresh[aimd_exit]
+    state[fr_exit] = CONGESTION_AVOIDANCE
+    cubic_epoch |= fr_exit & is_cubic
+
+    # --- Cubic：開始新的擁塞避免階段 ---
+    if cubic_epoch.any():
+        flows['epoch_ns'][cubic_epoch] = now_ns
+        flows['k'][cubic_epoch] = _cubic_k(flows['wmax'][cubic_epoch])
+
+
+def ack_flows(flows: np.ndarray, n_acks, now_ns: Optional[int] = None):
+    """
+    對每條流套用 n_acks 個 ACK（原地更新 flows），整批只需一次呼叫
+    n_acks: 整數或與 flows 等長的陣列
+    Reno/NewReno 用與 apply_acks 相同的封閉形式一次算完；
+    Cubic 的增量依賴當前 cwnd，改為逐 ACK 對所有 Cubic 流向量化迭代
+    """
+    if now_ns is None:
+        now_ns = time.monotonic_ns()
+    n = np.broadcast_to(np.asarray(n_acks, dtype=np.int64), flows.shape)
+
+    cwnd = flows['cwnd']
+    ssthresh = flows['ssthresh']
+    state = flows['state']
+    is_cubic = flows['algo'] == ALGO_CUBIC
+    aimd = ~is_cubic & (n > 0)
+
+    # --- Reno/NewReno 慢啟動：到達 ssthresh 之前每個 ACK 加 1 ---
+    ss = aimd & (state == SLOW_START)
+    room = np.maximum(1.0, np.ceil(ssthresh - cwnd))
+    used = np.where(ss, np.minimum(n, room), 0.0)
+    cwnd[ss] += used[ss]
+    state[ss & (n >= room)] = CONGESTION_AVOIDANCE
+
+    # --- Reno/NewReno 擁塞避免：與 _apply_aimd_acks 相同的 W' = sqrt(W^2 + 2n + ln(1 + 2n/W^2) / 2) ---
+    rest = n - used
+    ca = aimd & (state == CONGESTION_AVOIDANCE) & (rest > 0)
+    w2 = np.square(cwnd[ca].astype(np.float64))
+    r2 = 2.0 * rest[ca]
+    cwnd[ca] = np.sqrt(w2 + r2 + 0.5 * np.log1p(r2 / w2))
+
+    # --- Cubic：逐 ACK 迭代，每輪處理所有還有 ACK 剩餘的流 ---
+    cubic = is_cubic & (n > 0)
+    if cubic.any():
+        events = np.zeros(flows.shape, dtype=np.int8)
+        for i in range(int(n[cubic].max())):
+            events[cubic & (n > i)] = EVENT_ACK
+            events[cubic & (n == i)] = EVENT_NONE
+            step_flows(flows, events, now_ns)
@@ -3,10 +3,11 @@ TCP模擬系統GUI界面
 """
 import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox
-import threading
 import time
-# 引入 Matplotlib 相關模組
-import matplotlib.pyplot as plt
+from collections import deque
+import itertools
+import numpy as np
+# 引入 Matplotlib 相關模組（圖表嵌入 Tk，直接用 Figure + Agg 畫布，不經過 pyplot）
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 import matplotlib
@@ -17,6 +18,50 @@ matplotlib.rcParams['axes.unicode_minus'] = False  # 解決負號顯示問題
 from tcp_simulator import TCPSimulator
 from tcp_packet import TCPFlag
 
+# 日誌文字框最多保留的行數，超過時從頂端刪除，長時間執行下插入成本不隨時間增加
+LOG_MAX_LINES = 2000
+# 圖表每條曲線最多保留的點數（滑動視窗），圖表更新成本不隨模擬時間增加
+CHART_MAX_POINTS = 1000
+
+
+# 日誌時間戳只到秒，同一秒內重用格式化好的字串：[整數秒, "HH:MM:SS"]
+_TS_CACHE = [-1, '']
+
+
+def _log_timestamp() -> str:
+    """目前時間的 HH:MM:SS 字串，每秒只呼叫一次 strftime"""
+    now = int(time.time())
+    if now != _TS_CACHE[0]:
+        _TS_CACHE[0] = now
+        _TS_CACHE[1] = time.strftime("%H:%M:%S", time.localtime(now))
+    return _TS_CACHE[1]
+
+
+class _PointBuffer:
+    """
+    保留最近 capacity 個 (時間, 數值) 點的環形緩衝區
+    底層是 2*capacity 列的陣列，寫滿時把最後 capacity 列搬回開頭，
+    因此 view() 永遠是一段連續切片，可直接交給 Line2D.set_data
+    """
+    __slots__ = ("_data", "_capacity", "_end")
+    
+    def __init__(self, capacity: int):
+        self._data = np.empty((2 * capacity, 2))
+        self._capacity = capacity
+        self._end = 0
+    
+    def append(self, t: float, value: float):
+        if self._end == len(self._data):
+            capacity = self._capacity
+            self._data[:capacity] = self._data[-capacity:]
+            self._end = capacity
+        self._data[self._end] = (t, value)
+        self._end += 1
+    
+    def view(self) -> np.ndarray:
+        """最近的點，形狀 (n, 2)：第 0 欄為時間、第 1 欄為數值"""
+        return self._data[max(0, self._end - self._capacity):self._end]
+
 
 class TCPSimulatorGUI:
     """TCP模擬器GUI"""
@@ -32,7 +77,14 @@ class TCPSimulatorGUI:
         self.simulator.create_connection(client_port=5000, server_port=8000)
         
         self.running = False
-        self.update_thread = None
+        # 待寫入的日誌 (時間戳, 訊息, 資料包)：_log 只負責排入，由主線程每 50ms 合併成一次 insert
+        self._log_buf = deque(maxlen=5000)
+        self._log_pending = False
+        # 上次寫入統計框的內容，未改變時不重寫文字框
+        self._last_stats_text = None
+        # 狀態標籤目前顯示的狀態
+        self._last_client_state = None
+        self._last_server_state = None
         
         self._create_widgets()
         self._start_update_loop()
@@ -161,7 +213,8 @@ class TCPSimulatorGUI:
         
         ttk.Label(state_frame, text="TCP狀態轉換", font=("Arial", 14, "bold")).pack(anchor=tk.W, pady=(0, 10))
         
-        self.state_canvas = tk.Canvas(state_frame, bg="white", width=800, height=600)
+        # 狀態圖是靜態的：畫布預設為 disabled，滑鼠移動時 Tk 不再逐一挑選目前所在的物件
+        self.state_canvas = tk.Canvas(state_frame, bg="white", width=800, height=600, state=tk.DISABLED)
         self.state_canvas.pack(fill=tk.BOTH, expand=True)
         self._draw_state_diagram()
 
@@ -173,12 +226,11 @@ class TCPSimulatorGUI:
 
         self.chart_figure = Figure(figsize=(5, 4), dpi=100)
         self.chart_plot = self.chart_figure.add_subplot(111)
-        self.chart_plot.set_title("Congestion Window (CWND) over Time")
-        self.chart_plot.set_xlabel("Time (s)")
-        self.chart_plot.set_ylabel("Segments (MSS)")
         
         self.chart_canvas = FigureCanvasTkAgg(self.chart_figure, master=chart_frame)
-        self.chart_canvas.draw()
+        # 每次整張圖重繪（含視窗縮放）後重新擷取背景，供 blit 使用
+        self.chart_canvas.mpl_connect('draw_event', self._on_chart_draw)
+        self._reset_chart()
         self.chart_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
         
         # 添加刷新按鈕
@@ -247,7 +299,7 @@ class TCPSimulatorGUI:
             self.congestion_algorithm = new_algorithm
             self._log(f"擁塞控制演算法已變更為: {new_algorithm}")
             # 只有在連接未建立時才能變更演算法
-            if self.simulator.client and self.simulator.client.state.value == "CLOSED":
+            if self.simulator.client and self.simulator.client.state.name == "CLOSED":
                 # 重新創建模擬器以應用新演算法
                 self.simulator = TCPSimulator(
                     network_delay=self.delay_var.get(),
@@ -266,7 +318,7 @@ class TCPSimulatorGUI:
         """開始連接"""
         # 檢查當前狀態，如果已經在連接過程中或已連接，先重置
         if self.simulator.client:
-            current_state = self.simulator.client.state.value
+            current_state = self.simulator.client.state.name
             if current_state not in ["CLOSED"]:
                 self._log(f"當前狀態為 {current_state}，無法建立新連接。請先重置連接。")
                 messagebox.showwarning("警告", f"當前連接狀態為 {current_state}，無法建立新連接。\n請先點擊「重置連接」按鈕。")
@@ -281,7 +333,9 @@ class TCPSimulatorGUI:
     
     def _send_data(self):
         """發送資料"""
-        data = self.data_entry.get().encode('utf-8')
+        # 只讀取、編碼一次；bytes 不可變，同一個物件可安全地給每個封包共用
+        text = self.data_entry.get()
+        data = text.encode('utf-8')
         if not data:
             messagebox.showwarning("警告", "請輸入要發送的資料")
             return
@@ -292,20 +346,18 @@ class TCPSimulatorGUI:
             messagebox.showwarning("警告", "發送數量必須至少為 1")
             return
         
-        self._log(f"=== 發送資料: {data.decode('utf-8')} (數量: {packet_count}) ===")
+        self._log(f"=== 發送資料: {text} (數量: {packet_count}) ===")
         
         # 發送指定數量的數據包
         connection = self.simulator.client
-        if connection and connection.state.value == "ESTABLISHED":
+        if connection and connection.state.name == "ESTABLISHED":
             # 發送指定數量的數據包，但受擁塞視窗限制
             sent_count = 0
-            for i in range(packet_count):
-                if len(connection.unacked_packets) < int(connection.congestion_window):
-                    self.simulator.send_data(data, from_client=True)
-                    sent_count += 1
-                else:
-                    # 擁塞視窗已滿，將剩餘數據放入緩衝區
-                    connection.send_buffer.append(data)
+            while sent_count < packet_count and len(connection.unacked_packets) < int(connection.congestion_window):
+                self.simulator.send_data(data, from_client=True)
+                sent_count += 1
+            # 擁塞視窗已滿，將剩餘數據一次放入緩衝區
+            connection.send_buffer.extend(itertools.repeat(data, packet_count - sent_count))
             
             if sent_count < packet_count:
                 self._log(f"已發送 {sent_count} 個封包，剩餘 {packet_count - sent_count} 個封包已放入緩衝區")
@@ -335,11 +387,7 @@ class TCPSimulatorGUI:
         self._log(f"連接已重置，使用演算法: {self.congestion_algorithm}")
         
         # 清除圖表
-        self.chart_plot.clear()
-        self.chart_plot.set_title("Congestion Window (CWND) over Time")
-        self.chart_plot.set_xlabel("Time (s)")
-        self.chart_plot.set_ylabel("Segments (MSS)")
-        self.chart_canvas.draw()
+        self._reset_chart()
     
     def _setup_simulator_callbacks(self):
         """設置模擬器回調函數"""
@@ -395,195 +443,304 @@ class TCPSimulatorGUI:
         self._log("連接已重置")
         
         # 清除圖表
-        self.chart_plot.clear()
-        self.chart_plot.set_title("Congestion Window (CWND) over Time")
-        self.chart_plot.set_xlabel("Time (s)")
-        self.chart_plot.set_ylabel("Segments (MSS)")
-        self.chart_canvas.draw()
+        self._reset_chart()
     
     def _on_state_change(self, old_state, new_state):
         """狀態改變回調"""
-        self._log(f"狀態改變: {old_state.value} -> {new_state.value}")
+        self._log(f"狀態改變: {old_state.name} -> {new_state.name}")
         self._update_state_labels()
     
     def _on_packet_sent(self, packet):
         """資料包發送回調"""
         source = "客戶端" if packet.source_port == 5000 else "伺服器"
-        self._log(f"[發送] {source}: {packet}")
+        self._log(f"[發送] {source}: ", packet)
     
     def _on_packet_received(self, packet):
         """資料包接收回調"""
         source = "客戶端" if packet.source_port == 5000 else "伺服器"
-        self._log(f"[接收] {source}: {packet}")
+        self._log(f"[接收] {source}: ", packet)
     
     def _on_packet_transmitted(self, packet, dest, status):
         """資料包傳輸回調"""
         if status == "LOST":
-            self._log(f"[丟失] 資料包在傳輸中丟失: {packet}")
+            self._log("[丟失] 資料包在傳輸中丟失: ", packet)
         elif status == "ARRIVED":
             self._log(f"[到達] 資料包已到達目的地")
     
-    def _log(self, message: str):
-        """添加日誌（線程安全）"""
-        timestamp = time.strftime("%H:%M:%S", time.localtime())
-        # 使用 after 確保在主線程中更新 GUI
-        self.root.after(0, lambda: self._log_unsafe(f"[{timestamp}] {message}\n"))
+    def _log(self, message: str, packet=None):
+        """
+        添加日誌（線程安全）：先放入緩衝區，批次寫入文字框
+        packet 不為 None 時接在 message 後面；字串化延後到 flush，會被裁掉的行不必格式化
+        """
+        # deque.append 本身是原子操作；每批只排程一次 flush，在主線程中更新 GUI
+        self._log_buf.append((_log_timestamp(), message, packet))
+        if not self._log_pending:
+            self._log_pending = True
+            self.root.after(50, self._flush_log)
+    
+    def _flush_log(self):
+        """內部方法：把緩衝區內的日誌合併成一次 insert（僅在主線程調用）"""
+        # 先清除旗標，flush 期間新加入的行會再排程下一次
+        self._log_pending = False
+        buf = self._log_buf
+        entries = []
+        while buf:
+            entries.append(buf.popleft())
+        # 超過文字框行數上限的部分插入後也會立刻被刪除，直接略過不格式化
+        if len(entries) > LOG_MAX_LINES:
+            entries = entries[-LOG_MAX_LINES:]
+        lines = [f"[{timestamp}] {message}\n" if packet is None else f"[{timestamp}] {message}{packet}\n"
+                 for timestamp, message, packet in entries]
+        if lines:
+            self._log_unsafe(''.join(lines))
     
     def _log_unsafe(self, message: str):
         """內部方法：直接更新日誌（僅在主線程調用）"""
         try:
             self.log_text.insert(tk.END, message)
+            # 'end-1c' 為最後一個字元的位置，其行號即目前行數
+            lines = int(self.log_text.index('end-1c').split('.')[0])
+            if lines > LOG_MAX_LINES:
+                self.log_text.delete('1.0', f'{lines - LOG_MAX_LINES}.0')
             self.log_text.see(tk.END)
         except Exception as e:
             print(f"日誌更新錯誤: {e}")
     
     def _update_state_labels(self):
-        """更新狀態標籤"""
+        """更新狀態標籤（狀態未改變時不重設標籤，避免多餘的版面計算）"""
         if self.simulator.client:
-            self.client_state_label.config(
-                text=f"客戶端: {self.simulator.client.state.value}")
+            state = self.simulator.client.state
+            if state != self._last_client_state:
+                self._last_client_state = state
+                self.client_state_label.config(text=f"客戶端: {state.name}")
         if self.simulator.server:
-            self.server_state_label.config(
-                text=f"伺服器: {self.simulator.server.state.value}")
+            state = self.simulator.server.state
+            if state != self._last_server_state:
+                self._last_server_state = state
+                self.server_state_label.config(text=f"伺服器: {state.name}")
     
     def _update_stats(self):
         """更新統計資訊"""
         stats = self.simulator.get_stats()
-        self.stats_text.delete(1.0, tk.END)
+        parts = []
         
         if 'client' in stats:
-            self.stats_text.insert(tk.END, "=== 客戶端統計 ===\n")
+            parts.append("=== 客戶端統計 ===\n")
             for key, value in stats['client'].items():
-                self.stats_text.insert(tk.END, f"{key}: {value}\n")
-            self.stats_text.insert(tk.END, "\n")
+                parts.append(f"{key}: {value}\n")
+            parts.append("\n")
         
         if 'server' in stats:
-            self.stats_text.insert(tk.END, "=== 伺服器統計 ===\n")
+            parts.append("=== 伺服器統計 ===\n")
             for key, value in stats['server'].items():
-                self.stats_text.insert(tk.END, f"{key}: {value}\n")
+                parts.append(f"{key}: {value}\n")
+        
+        # 內容與上次相同時不動文字框；有變化才整段替換一次
+        text = ''.join(parts)
+        if text == self._last_stats_text:
+            return
+        self._last_stats_text = text
+        self.stats_text.delete(1.0, tk.END)
+        self.stats_text.insert(tk.END, text)
+    
+    def _reset_chart(self):
+        """清空圖表並建立常駐的曲線與事件標記；之後的更新只改資料，以 blit 重繪"""
+        ax = self.chart_plot
+        ax.clear()
+        ax.set_title("Congestion Control Analysis")
+        ax.set_xlabel("Time (s)")
+        ax.set_ylabel("Window Size (MSS)")
+        ax.grid(True, alpha=0.3)
+        # animated=True：整張圖重繪時不畫這些物件，由 blit 疊在快取的背景上
+        self._cwnd_line, = ax.plot([], [], label='CWND', color='blue', marker='.', linestyle='-', linewidth=2,
+                                   markersize=6, drawstyle='steps-post', animated=True)
+        self._ssthresh_line, = ax.plot([], [], label='SSTHRESH', color='red', marker='s', linestyle='--', linewidth=2,
+                                       markersize=6, drawstyle='steps-post', animated=True)
+        # 事件標記：loss (紅點)、rto (紅叉)、fast retransmit (黃三角)
+        self._event_lines = {
+            'loss': ax.plot([], [], color='red', marker='o', linestyle='None', markersize=8,
+                            label='Loss', animated=True)[0],
+            'rto': ax.plot([], [], color='darkred', marker='x', linestyle='None', markersize=9,
+                           label='RTO', animated=True)[0],
+            'fast': ax.plot([], [], color='orange', marker='^', linestyle='None', markersize=8,
+                            label='Fast RTX', animated=True)[0],
+        }
+        self._chart_artists = [self._cwnd_line, self._ssthresh_line, *self._event_lines.values()]
+        self._chart_message = ax.text(0.5, 0.5, '暫無數據\n請先建立連接並發送資料',
+                                      ha='center', va='center', transform=ax.transAxes, fontsize=12)
+        self._chart_legend_labels = ()
+        # 圖表資料：從指標歷史增量讀入，只保留最近 CHART_MAX_POINTS 點
+        self._chart_cursor = 0
+        self._chart_start = None
+        self._chart_latest = 0.0
+        self._chart_last_cwnd = None
+        self._chart_last_ssthresh = None
+        self._cwnd_points = _PointBuffer(CHART_MAX_POINTS)
+        self._ssthresh_points = _PointBuffer(CHART_MAX_POINTS)
+        self._event_points = {key: _PointBuffer(CHART_MAX_POINTS) for key in self._event_lines}
+        ax.set_xlim(0, 1)
+        ax.set_ylim(0, 1)
+        self._chart_bg = None
+        self.chart_canvas.draw()
+    
+    def _on_chart_draw(self, event):
+        """整張圖重繪後擷取不含曲線的背景，再把曲線畫上"""
+        self._chart_bg = self.chart_canvas.copy_from_bbox(self.chart_figure.bbox)
+        for artist in self._chart_artists:
+            self.chart_plot.draw_artist(artist)
+    
+    def _blit_chart(self):
+        """還原背景、只重畫曲線與事件標記，再把圖表區域貼回畫面"""
+        self.chart_canvas.restore_region(self._chart_bg)
+        for artist in self._chart_artists:
+            self.chart_plot.draw_artist(artist)
+        self.chart_canvas.blit(self.chart_figure.bbox)
+    
+    def _ingest_metric_history(self):
+        """只處理上次之後新增的指標記錄，累積到固定長度的曲線緩衝區"""
+        history = self.simulator.get_metric_history()
+        if len(history) < self._chart_cursor:
+            # 模擬器已更換，歷史重新開始
+            self._reset_chart()
+        new_records = history[self._chart_cursor:]
+        self._chart_cursor = len(history)
+        
+        # 迴圈內只用區域變數與預先綁定的方法，結束後再寫回
+        start = self._chart_start
+        latest = self._chart_latest
+        last_cwnd = self._chart_last_cwnd
+        last_ssthresh = self._chart_last_ssthresh
+        cwnd_append = self._cwnd_points.append
+        ssthresh_append = self._ssthresh_points.append
+        loss_append = self._event_points['loss'].append
+        rto_append = self._event_points['rto'].append
+        fast_append = self._event_points['fast'].append
+        
+        for record in new_records:
+            get = record.get
+            record_type = get('type')
+            if record_type != 'METRIC' and record_type != 'EVENT':
+                continue
+            # 以第一筆記錄的時間為起點計算相對時間
+            if start is None:
+                start = get('time', 0)
+            rel_time = get('time', 0) - start
+            if record_type == 'METRIC':
+                if rel_time > latest:
+                    latest = rel_time
+                if get('metric', '') == 'cc':
+                    # 一筆記錄同時帶 (cwnd, ssthresh)，只把有變化的那一項加入曲線
+                    cwnd, ssthresh = get('value', 0)
+                    if cwnd != last_cwnd:
+                        cwnd_append(rel_time, cwnd)
+                        last_cwnd = cwnd
+                    if ssthresh != last_ssthresh:
+                        ssthresh_append(rel_time, ssthresh)
+                        last_ssthresh = ssthresh
+            else:
+                ev = get('event')
+                # 事件的Y值用最後一筆 cwnd（若無則用 ssthresh 或 0）
+                y_val = last_cwnd if last_cwnd is not None else (last_ssthresh if last_ssthresh is not None else 0)
+                if ev == 'loss':
+                    loss_append(rel_time, y_val)
+                elif ev == 'rto_event' or ev == 'rto':
+                    rto_append(rel_time, y_val)
+                elif ev == 'fast_retx_event' or ev == 'fast':
+                    fast_append(rel_time, y_val)
+        
+        self._chart_start = start
+        self._chart_latest = latest
+        self._chart_last_cwnd = last_cwnd
+        self._chart_last_ssthresh = last_ssthresh
     
     def _update_charts(self):
         """更新圖表"""
         try:
-            history = self.simulator.get_metric_history()
-            
-            if not history:
+            # 自上次更新以來沒有新記錄時，圖表內容不會改變
+            history_len = self.simulator.metric_history_len()
+            if history_len == self._chart_cursor:
+                return
+            if not history_len:
                 # 如果沒有歷史數據，顯示提示
-                self.chart_plot.clear()
-                self.chart_plot.text(0.5, 0.5, '暫無數據\n請先建立連接並發送資料', 
-                                   ha='center', va='center', transform=self.chart_plot.transAxes,
-                                   fontsize=12)
-                self.chart_plot.set_title("Congestion Control Analysis")
-                self.chart_canvas.draw()
+                if self._chart_legend_labels or not self._chart_message.get_visible():
+                    self._reset_chart()
                 return
-
-            # 整理數據
-            times_cwnd = []
-            cwnds = []
-            times_ssthresh = []
-            ssthreshs = []
-            # 事件標記
-            event_times = {'loss': [], 'rto': [], 'fast': []}
-            event_vals = {'loss': [], 'rto': [], 'fast': []}
-            last_cwnd = None
-            
-            # 找到開始時間以計算相對時間
-            start_time = None
-            for record in history:
-                if record.get('type') in ('METRIC', 'EVENT'):
-                    if start_time is None:
-                        start_time = record.get('time', 0)
-                    break
             
-            if start_time is None:
-                start_time = time.time()
+            self._ingest_metric_history()
             
-            for record in history:
-                if record.get('type') == 'METRIC':
-                    record_time = record.get('time', 0)
-                    rel_time = record_time - start_time
-                    metric = record.get('metric', '')
-                    value = record.get('value', 0)
-                    
-                    if metric == 'cwnd':
-                        times_cwnd.append(rel_time)
-                        cwnds.append(value)
-                        last_cwnd = value
-                    elif metric == 'ssthresh':
-                        times_ssthresh.append(rel_time)
-                        ssthreshs.append(value)
-                elif record.get('type') == 'EVENT':
-                    record_time = record.get('time', 0)
-                    rel_time = record_time - start_time
-                    ev = record.get('event')
-                    # 事件的Y值用最後一筆 cwnd（若無則用 ssthresh 或 0）
-                    y_val = last_cwnd if last_cwnd is not None else (ssthreshs[-1] if ssthreshs else 0)
-                    if ev == 'loss':
-                        event_times['loss'].append(rel_time)
-                        event_vals['loss'].append(y_val)
-                    elif ev == 'rto_event' or ev == 'rto':
-                        event_times['rto'].append(rel_time)
-                        event_vals['rto'].append(y_val)
-                    elif ev == 'fast_retx_event' or ev == 'fast':
-                        event_times['fast'].append(rel_time)
-                        event_vals['fast'].append(y_val)
+            # 整理數據（每條曲線最多 CHART_MAX_POINTS 點，皆為陣列切片，不複製）
+            cwnd_points = self._cwnd_points.view()
+            ssthresh_points = self._ssthresh_points.view()
+            latest_time = self._chart_latest
             
-            # 繪圖
-            self.chart_plot.clear()
+            # 連接只在 cwnd/ssthresh 改變時回報，最後的值延伸到最新時間點，並以階梯線繪製
+            if len(cwnd_points) and cwnd_points[-1, 0] < latest_time:
+                cwnd_points = np.concatenate((cwnd_points, [(latest_time, cwnd_points[-1, 1])]))
+            if len(ssthresh_points) and ssthresh_points[-1, 0] < latest_time:
+                ssthresh_points = np.concatenate((ssthresh_points, [(latest_time, ssthresh_points[-1, 1])]))
             
-            # 只有在有數據時才繪圖
-            if times_cwnd and cwnds and len(times_cwnd) > 0:
-                # 確保數據點足夠多才能繪製線條
-                if len(times_cwnd) == 1:
-                    # 只有一個點時，使用散點圖
-                    self.chart_plot.scatter(times_cwnd, cwnds, label='CWND', color='blue', s=50, marker='o')
-                else:
-                    # 多個點時，繪製線條
-                    self.chart_plot.plot(times_cwnd, cwnds, label='CWND', color='blue', marker='.', linestyle='-', linewidth=2, markersize=6)
+            # 只更新常駐物件的資料，不重建圖表
+            self._cwnd_line.set_data(cwnd_points[:, 0], cwnd_points[:, 1])
+            self._ssthresh_line.set_data(ssthresh_points[:, 0], ssthresh_points[:, 1])
+            for key, line in self._event_lines.items():
+                points = self._event_points[key].view()
+                line.set_data(points[:, 0], points[:, 1])
             
-            if times_ssthresh and ssthreshs and len(times_ssthresh) > 0:
-                if len(times_ssthresh) == 1:
-                    self.chart_plot.scatter(times_ssthresh, ssthreshs, label='SSTHRESH', color='red', s=50, marker='s')
-                else:
-                    self.chart_plot.plot(times_ssthresh, ssthreshs, label='SSTHRESH', color='red', marker='s', linestyle='--', linewidth=2, markersize=6)
-            # 事件標記：loss (紅點)、rto (紅叉)、fast retransmit (黃三角)
-            if event_times['loss']:
-                self.chart_plot.scatter(event_times['loss'], event_vals['loss'], c='red', marker='o', s=60, label='Loss')
-            if event_times['rto']:
-                self.chart_plot.scatter(event_times['rto'], event_vals['rto'], c='darkred', marker='x', s=80, label='RTO')
-            if event_times['fast']:
-                self.chart_plot.scatter(event_times['fast'], event_vals['fast'], c='orange', marker='^', s=70, label='Fast RTX')
+            # 以下變化屬於背景（文字、圖例、座標軸），需要整張重繪；其餘情況只 blit 曲線
+            full_redraw = self._chart_bg is None
             
             # 如果沒有任何數據，顯示提示
-            if not times_cwnd and not times_ssthresh:
-                self.chart_plot.text(0.5, 0.5, '暫無擁塞控制數據\n請先建立連接並發送資料', 
-                                   ha='center', va='center', transform=self.chart_plot.transAxes,
-                                   fontsize=12)
+            all_points = np.concatenate((cwnd_points, ssthresh_points))
+            if not len(all_points):
+                if not self._chart_message.get_visible():
+                    self._chart_message.set_text('暫無擁塞控制數據\n請先建立連接並發送資料')
+                    self._chart_message.set_visible(True)
+                    full_redraw = True
+            elif self._chart_message.get_visible():
+                self._chart_message.set_visible(False)
+                full_redraw = True
             
-            self.chart_plot.set_title("Congestion Control Analysis")
-            self.chart_plot.set_xlabel("Time (s)")
-            self.chart_plot.set_ylabel("Window Size (MSS)")
-            self.chart_plot.grid(True, alpha=0.3)
-            if times_cwnd or times_ssthresh:
-                self.chart_plot.legend()
+            # 圖例只列出有資料的項目
+            shown = [artist for artist in self._chart_artists if len(artist.get_xdata())]
+            labels = tuple(artist.get_label() for artist in shown)
+            if labels != self._chart_legend_labels:
+                self._chart_legend_labels = labels
+                if shown:
+                    self.chart_plot.legend(handles=shown)
+                elif self.chart_plot.get_legend():
+                    self.chart_plot.get_legend().remove()
+                full_redraw = True
             
-            # 自動調整座標軸範圍
-            if times_cwnd or times_ssthresh:
-                all_times = times_cwnd + times_ssthresh
-                all_values = cwnds + ssthreshs
-                if all_times and all_values:
-                    x_margin = max(0.1, (max(all_times) - min(all_times)) * 0.1) if len(all_times) > 1 else 0.1
-                    # 提高縱軸緩衝，避免 CWND 超過 ssthresh 時被截斷
-                    value_span = max(all_values) - min(all_values)
-                    y_margin = max(
-                        1.0,
-                        value_span * 0.2,   # 20% 頭尾留白
-                        max(all_values) * 0.1  # 最高值再留 10%
-                    ) if len(all_values) > 1 else max(1.0, max(all_values) * 0.2)
-                    self.chart_plot.set_xlim(min(all_times) - x_margin, max(all_times) + x_margin)
-                    self.chart_plot.set_ylim(max(0, min(all_values) - y_margin), max(all_values) + y_margin)
+            # 自動調整座標軸範圍：資料超出目前範圍才擴大，並預留空間，讓大多數更新不必重繪座標軸
+            if len(all_points):
+                t_min, v_min = all_points.min(axis=0)
+                t_max, v_max = all_points.max(axis=0)
+                x_margin = max(0.1, (t_max - t_min) * 0.1) if len(all_points) > 1 else 0.1
+                # 提高縱軸緩衝，避免 CWND 超過 ssthresh 時被截斷
+                value_span = v_max - v_min
+                y_margin = max(
+                    1.0,
+                    value_span * 0.2,   # 20% 頭尾留白
+                    v_max * 0.1  # 最高值再留 10%
+                ) if len(all_points) > 1 else max(1.0, v_max * 0.2)
+                x_lo, x_hi = t_min - x_margin, t_max + x_margin
+                y_lo, y_hi = max(0, v_min - y_margin), v_max + y_margin
+                cur_x_lo, cur_x_hi = self.chart_plot.get_xlim()
+                # 舊的點滑出視窗後，左側空白超過一半寬度也重新調整
+                if x_lo < cur_x_lo or x_hi > cur_x_hi or x_lo - cur_x_lo > (cur_x_hi - cur_x_lo) * 0.5:
+                    # 時間軸持續增長，多留一半寬度，之後幾次更新都落在範圍內
+                    self.chart_plot.set_xlim(x_lo, x_hi + (x_hi - x_lo) * 0.5)
+                    full_redraw = True
+                cur_y_lo, cur_y_hi = self.chart_plot.get_ylim()
+                if y_lo < cur_y_lo or y_hi > cur_y_hi:
+                    self.chart_plot.set_ylim(min(y_lo, cur_y_lo), max(y_hi, cur_y_hi))
+                    full_redraw = True
             
-            self.chart_canvas.draw()
+            if full_redraw:
+                # draw_event 會重新擷取背景並畫上曲線
+                self.chart_canvas.draw()
+            else:
+                self._blit_chart()
         except Exception as e:
             # 如果出錯，顯示錯誤信息
             import traceback
@@ -591,39 +748,42 @@ class TCPSimulatorGUI:
             traceback.print_exc()
     
     def _start_update_loop(self):
-        """啟動更新循環"""
-        def update():
-            last_chart_update = 0
-            while True:
-                try:
-                    self.simulator.update()
-                    # 在主線程中更新 GUI 組件
-                    self.root.after(0, self._update_state_labels)
-                    self.root.after(0, self._update_stats)
-                    
-                    # 每0.5秒自動刷新圖表一次（如果數據有變化）
-                    current_time = time.time()
-                    if current_time - last_chart_update >= 0.5:
-                        # 在主線程中更新圖表
-                        self.root.after(0, self._update_charts)
-                        last_chart_update = current_time
-                    
-                    time.sleep(0.05)  # 減少延遲，提高響應速度
-                except Exception as e:
-                    # 打印錯誤以便調試
-                    import traceback
-                    error_msg = f"更新循環錯誤: {e}"
-                    print(error_msg)
-                    traceback.print_exc()
-                    # 只在主線程中記錄錯誤
-                    try:
-                        self.root.after(0, lambda msg=error_msg: self._log_unsafe(f"[錯誤] {msg}\n"))
-                    except:
-                        pass
-                    time.sleep(0.1)  # 發生錯誤時稍作延遲
-        
-        self.update_thread = threading.Thread(target=update, daemon=True)
-        self.update_thread.start()
+        """啟動更新循環：模擬推進與介面更新都以 after 排程在 Tk 主線程執行"""
+        self._tick()
+        self._refresh_stats()
+        self._refresh_charts()
+    
+    def _tick(self):
+        """推進模擬一步並更新狀態標籤，之後在下一個模擬事件到期時（最多 50ms 後）重新排程自己"""
+        delay = 50  # 毫秒
+        try:
+            self.simulator.update()
+            self._update_state_labels()
+            next_time = self.simulator.next_event_time()
+            if next_time is not None:
+                delay = min(delay, max(1, int((next_time - time.time()) * 1000) + 1))
+        except Exception as e:
+            # 打印錯誤以便調試
+            import traceback
+            error_msg = f"更新循環錯誤: {e}"
+            print(error_msg)
+            traceback.print_exc()
+            self._log_unsafe(f"[錯誤] {error_msg}\n")
+            delay = 100  # 發生錯誤時稍作延遲
+        finally:
+            self.root.after(delay, self._tick)
+    
+    def _refresh_stats(self):
+        """統計資訊不需要 20Hz，每0.5秒刷新一次"""
+        try:
+            self._update_stats()
+        finally:
+            self.root.after(500, self._refresh_stats)
+    
+    def _refresh_charts(self):
+        """每0.5秒自動刷新圖表一次（_update_charts 自行處理錯誤）"""
+        self._update_charts()
+        self.root.after(500, self._refresh_charts)
 
 
 def main():
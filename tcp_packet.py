@@ -2,8 +2,9 @@
 TCP資料包類
 模擬TCP資料包的結構和功能
 """
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import IntFlag
+import functools
 import time
 
 
@@ -16,7 +17,20 @@ class TCPFlag(IntFlag):
     PSH = 0x08
 
 
-@dataclass
+# __str__ 的標誌位顯示順序
+_FLAG_NAMES = ((int(TCPFlag.SYN), "SYN"), (int(TCPFlag.ACK), "ACK"), (int(TCPFlag.FIN), "FIN"),
+               (int(TCPFlag.RST), "RST"), (int(TCPFlag.PSH), "PSH"))
+
+
+@functools.lru_cache(maxsize=None)
+def _flags_to_str(flags: int) -> str:
+    """標誌位組合的顯示字串；實際出現的組合只有少數幾種，以組合值快取"""
+    return ','.join(name for bit, name in _FLAG_NAMES if flags & bit) or 'NONE'
+
+
+# 資料包無法安全回收重用（歷史記錄與網路佇列都持有參照），
+# 改以 __slots__ 省去每個實例的 __dict__，降低建立成本與記憶體
+@dataclass(slots=True)
 class TCPPacket:
     """TCP資料包"""
     source_port: int
@@ -27,42 +41,34 @@ class TCPPacket:
     window_size: int
     data: bytes = b''
     timestamp: float = 0.0
+    # 資料包大小在建立時算一次；資料建立後不再改變
+    size: int = field(init=False, repr=False, compare=False)
     
     def __post_init__(self):
         if self.timestamp == 0.0:
             self.timestamp = time.time()
+        self.size = 20 + len(self.data)  # TCP頭部20位元組 + 資料
     
+    # 以下直接讀取成員的 _value_（一般實例屬性），避免 .value 經過 Enum 描述器
     def has_flag(self, flag: TCPFlag) -> bool:
         """檢查是否包含指定標誌位"""
-        return (self.flags & flag.value) != 0
+        return (self.flags & flag._value_) != 0
     
     def set_flag(self, flag: TCPFlag):
         """設置標誌位"""
-        self.flags |= flag.value
+        self.flags |= flag._value_
     
     def clear_flag(self, flag: TCPFlag):
         """清除標誌位"""
-        self.flags &= ~flag.value
+        self.flags &= ~flag._value_
     
     def get_size(self) -> int:
         """獲取資料包大小（位元組）"""
-        return 20 + len(self.data)  # TCP頭部20位元組 + 資料
+        return self.size
     
     def __str__(self) -> str:
-        flags_str = []
-        if self.has_flag(TCPFlag.SYN):
-            flags_str.append("SYN")
-        if self.has_flag(TCPFlag.ACK):
-            flags_str.append("ACK")
-        if self.has_flag(TCPFlag.FIN):
-            flags_str.append("FIN")
-        if self.has_flag(TCPFlag.RST):
-            flags_str.append("RST")
-        if self.has_flag(TCPFlag.PSH):
-            flags_str.append("PSH")
-        
         return (f"TCP[{self.source_port}->{self.dest_port}] "
                 f"SEQ={self.seq_num} ACK={self.ack_num} "
-                f"FLAGS={','.join(flags_str) if flags_str else 'NONE'} "
+                f"FLAGS={_flags_to_str(self.flags)} "
                 f"WIN={self.window_size} DATA={len(self.data)}B")
 
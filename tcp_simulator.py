@@ -4,107 +4,215 @@ TCP模擬器
 """
 import time
 import random
-from typing import List, Dict, Optional, Callable
+import heapq
+import itertools
+from collections import deque
+from typing import Any, List, Dict, Optional, Callable, Tuple
 from queue import Queue
 from tcp_connection import TCPConnection, TCPState
-from tcp_packet import TCPPacket
+from tcp_packet import TCPPacket, TCPFlag
+
+
+# 只帶 ACK 標誌位的控制包（無資料）
+_PURE_ACK_FLAGS = int(TCPFlag.ACK)
+
+
+# 傳輸時間低於此值（秒）時視為可忽略，無延遲、不丟包的網路可直接交付
+INSTANT_DELIVERY_MAX = 1e-3
+
+# packet_history 最多保留的筆數（各類型共用一條時間線），長時間模擬下記憶體不會無限增長
+HISTORY_MAXLEN = 10000
+# packet_history 記錄的 'type' 值
+HISTORY_TYPES = ('STATE_CHANGE', 'PACKET_SENT', 'PACKET_RECEIVED', 'PACKET_TRANSMITTED')
+
+
+def _is_pure_ack(packet: TCPPacket) -> bool:
+    """是否為純 ACK（只有 ACK 標誌位且不帶資料）"""
+    return packet.flags == _PURE_ACK_FLAGS and not packet.data
+
+
+def _conn_key(local_port: int, remote_port: int) -> int:
+    """連接表的鍵：兩個 16 位元埠號打包成一個整數，雜湊與比較都比元組便宜"""
+    return (local_port << 16) | remote_port
 
 
 class NetworkSimulator:
     """網路模擬器"""
     
+    # 每次傳輸都會讀取這些屬性，以 __slots__ 固定欄位
+    __slots__ = ("delay", "loss_rate", "bandwidth", "ack_filter", "_random",
+                 "packet_queue", "_queue_seq", "_immediate", "connections",
+                 "on_packet_transmitted")
+    
     def __init__(self, delay: float = 0.1, loss_rate: float = 0.0, 
-                 bandwidth: float = 1000.0):
+                 bandwidth: float = 1000.0, ack_filter: bool = False,
+                 seed: Optional[int] = None):
         """
         初始化網路模擬器
         :param delay: 網路延遲（秒）
         :param loss_rate: 丟包率（0.0-1.0）
         :param bandwidth: 頻寬（KB/s）
+        :param ack_filter: 是否過濾被後續 ACK 涵蓋的純 ACK（擁塞演算法按 ACK 個數增長，開啟後 cwnd 增長會變慢）
+        :param seed: 丟包判定用的亂數種子，指定後丟包序列可重現
         """
         self.delay = delay
         self.loss_rate = loss_rate
         self.bandwidth = bandwidth
-        self.packet_queue: List[Dict] = []  # {packet, timestamp, dest}
-        self.connections: Dict[tuple, TCPConnection] = {}  # (port1, port2) -> connection
+        self.ack_filter = ack_filter
+        # 指定種子時用獨立的亂數產生器，不受其他模組呼叫 random 影響；否則沿用全域 random
+        self._random = random.random if seed is None else random.Random(seed).random
+        # 依到達時間排序的最小堆 (arrival_time, 序號, packet, dest)；序號讓同時到達者依送出順序，且不比較到資料包
+        self.packet_queue: List[Tuple[float, int, TCPPacket, TCPConnection]] = []
+        self._queue_seq = itertools.count()
+        # 無延遲且不丟包時直接交付的 (packet, dest)，不經過堆；下一次 process_queue 全部取出
+        self._immediate: deque = deque()
+        self.connections: Dict[int, TCPConnection] = {}  # _conn_key(local_port, remote_port) -> connection
         self.on_packet_transmitted: Optional[Callable] = None
     
     def add_connection(self, connection: TCPConnection):
         """添加TCP連接"""
-        key = (connection.local_port, connection.remote_port)
-        self.connections[key] = connection
+        self.connections[_conn_key(connection.local_port, connection.remote_port)] = connection
     
-    def transmit_packet(self, packet: TCPPacket, dest_connection: TCPConnection):
-        """傳輸資料包"""
-        # 檢查是否丟包
-        if random.random() < self.loss_rate:
+    def transmit_packet(self, packet: TCPPacket, dest_connection: TCPConnection,
+                        now: Optional[float] = None):
+        """
+        傳輸資料包
+        now: 呼叫端本輪已讀取的 time.time()，同一輪多次傳輸共用，未提供時才讀取時鐘
+        """
+        # 檢查是否丟包（丟包率為 0 時不抽亂數）
+        loss_rate = self.loss_rate
+        if loss_rate and self._random() < loss_rate:
             if self.on_packet_transmitted:
                 self.on_packet_transmitted(packet, None, "LOST")
             return
         
         # 計算傳輸時間（考慮頻寬）
-        packet_size_kb = packet.get_size() / 1024.0
+        packet_size_kb = packet.size / 1024.0
         transmission_time = packet_size_kb / self.bandwidth
         
+        if not loss_rate and not self.delay and transmission_time < INSTANT_DELIVERY_MAX and not self.packet_queue:
+            # 無延遲、不丟包且傳輸時間可忽略：省去時鐘讀取與堆操作，下一次 process_queue 直接交付。
+            # 堆中還有未到達的資料包時（例如延遲剛改為 0）照常入堆，不讓新資料包超車
+            self._immediate.append((packet, dest_connection))
+            if self.on_packet_transmitted:
+                self.on_packet_transmitted(packet, dest_connection, "TRANSMITTING")
+            return
+        
         # 添加到队列
-        arrival_time = time.time() + self.delay + transmission_time
-        self.packet_queue.append({
-            'packet': packet,
-            'arrival_time': arrival_time,
-            'dest': dest_connection
-        })
+        if now is None:
+            now = time.time()
+        arrival_time = now + self.delay + transmission_time
+        heapq.heappush(self.packet_queue, (arrival_time, next(self._queue_seq), packet, dest_connection))
         
         if self.on_packet_transmitted:
             self.on_packet_transmitted(packet, dest_connection, "TRANSMITTING")
     
-    def process_queue(self):
-        """處理資料包佇列"""
-        current_time = time.time()
-        ready_packets = []
-        remaining_packets = []
+    def process_queue(self, now: Optional[float] = None):
+        """處理資料包佇列（now 同 transmit_packet）"""
+        current_time = time.time() if now is None else now
+        queue = self.packet_queue
+        immediate = self._immediate
+        # 堆頂尚未到達且沒有直接交付的資料包：本輪無事可做（以 UI 定時驅動時多數輪次如此）
+        if not immediate and (not queue or queue[0][0] > current_time):
+            return
+        # 迴圈內只用區域變數與預先綁定的方法
+        on_transmitted = self.on_packet_transmitted  # 回調在本輪內不會改變，只讀取一次
+        heappop = heapq.heappop
         
-        for item in self.packet_queue:
-            if current_time >= item['arrival_time']:
-                ready_packets.append(item)
-            else:
-                remaining_packets.append(item)
+        # 直接交付的資料包排在前面：只有堆為空時才會直接交付，它們都比堆中的資料包先送出；
+        # 再從堆頂取出已到達的資料包，未到達的留在堆中不必走訪（本輪產生的回應在取出之後才加入，留到下一輪）
+        arrived = list(immediate)
+        immediate.clear()
+        arrived_append = arrived.append
+        while queue and queue[0][0] <= current_time:
+            arrived_append(heappop(queue)[2:])
         
-        self.packet_queue = remaining_packets
+        if self.ack_filter:
+            # ACK 過濾（同 CAKE）：純 ACK 緊接在送往同一連接、確認號較小的純 ACK 之後時，
+            # 舊的 ACK 已被新的涵蓋，不再交給接收端處理；確認號相同（重複 ACK）時不過濾
+            ready_packets = []
+            filtered_packets = []
+            ready_append = ready_packets.append
+            for packet, dest in arrived:
+                if ready_packets and _is_pure_ack(packet):
+                    prev_packet, prev_dest = ready_packets[-1]
+                    if (prev_dest is dest and _is_pure_ack(prev_packet)
+                            and prev_packet.ack_num < packet.ack_num):
+                        filtered_packets.append(ready_packets[-1])
+                        ready_packets[-1] = (packet, dest)
+                        continue
+                ready_append((packet, dest))
+            if on_transmitted:
+                for packet, dest in filtered_packets:
+                    on_transmitted(packet, dest, "FILTERED")
+        else:
+            ready_packets = arrived
         
         # 處理就緒的資料包
-        for item in ready_packets:
-            packet = item['packet']
-            dest = item['dest']
-            
-            if self.on_packet_transmitted:
-                self.on_packet_transmitted(packet, dest, "ARRIVED")
+        connections_get = self.connections.get
+        transmit = self.transmit_packet
+        for packet, dest in ready_packets:
+            if on_transmitted:
+                on_transmitted(packet, dest, "ARRIVED")
             
             # 接收資料包並獲取響應
             response = dest.receive_packet(packet)
             
             if response:
-                # 找到發送方連接
-                sender_key = (dest.remote_port, dest.local_port)
-                sender = self.connections.get(sender_key)
+                # 找到發送方連接（鍵同 _conn_key，此處內聯）
+                sender = connections_get((dest.remote_port << 16) | dest.local_port)
                 if sender:
-                    self.transmit_packet(response, sender)
+                    transmit(response, sender, current_time)
     
-    def update(self):
+    def update(self, now: Optional[float] = None):
         """更新模擬器狀態"""
-        self.process_queue()
+        self.process_queue(now)
+    
+    def next_arrival_time(self) -> Optional[float]:
+        """佇列中最早到達的資料包的到達時間，佇列為空時為 None（有待直接交付者時為 0.0，即已到期）"""
+        if self._immediate:
+            return 0.0
+        return self.packet_queue[0][0] if self.packet_queue else None
 
 
 class TCPSimulator:
     """TCP模擬器主類"""
     
+    __slots__ = ("network", "client", "server", "packet_history", "_history_append", "metric_history", "_metric_append",
+                 "running", "congestion_algorithm", "record_history",
+                 "_port_label", "_port_conn", "_port_peer", "_forward", "_reverse")
+    
     def __init__(self, network_delay: float = 0.1, loss_rate: float = 0.0,
-                 bandwidth: float = 1000.0, congestion_algorithm: str = "Reno"):
-        self.network = NetworkSimulator(network_delay, loss_rate, bandwidth)
+                 bandwidth: float = 1000.0, congestion_algorithm: str = "Reno",
+                 record_history: bool = True, seed: Optional[int] = None,
+                 ack_filter: bool = False):
+        """
+        :param record_history: 是否記錄狀態/資料包歷史（含丟包標記）；關閉時不掛上這些回調，
+                               連接與網路端的 None 檢查直接略過，指標歷史照常記錄
+        :param seed: 網路丟包判定的亂數種子（見 NetworkSimulator）
+        :param ack_filter: 是否過濾被後續 ACK 涵蓋的純 ACK（見 NetworkSimulator）
+        """
+        self.network = NetworkSimulator(network_delay, loss_rate, bandwidth,
+                                        ack_filter=ack_filter, seed=seed)
         self.client: Optional[TCPConnection] = None
         self.server: Optional[TCPConnection] = None
-        self.packet_history: List[Dict] = []
+        # 各類型共用一條有上限的時間線，保持記錄順序；依類型讀取時線性過濾（最多 HISTORY_MAXLEN 筆）
+        self.packet_history: deque = deque(maxlen=HISTORY_MAXLEN)
+        self._history_append = self.packet_history.append
         self.metric_history: List[Dict] = [] # 新增：指標歷史數據
+        # 指標回調每個 ACK 都可能觸發，預先綁定 append
+        self._metric_append = self.metric_history.append
         self.running = False
         self.congestion_algorithm = congestion_algorithm
+        self.record_history = record_history
+        # 來源埠 -> 記錄用的端點標籤，建立連接時設定
+        self._port_label: Dict[int, str] = {}
+        # 本地埠 -> 連接，以及來源埠 -> 對端連接，供重傳封包決定轉發目標
+        self._port_conn: Dict[int, TCPConnection] = {}
+        self._port_peer: Dict[int, TCPConnection] = {}
+        # (發送端, 接收端)：客戶端 -> 伺服器為 forward，反方向為 reverse
+        self._forward: Tuple[Optional[TCPConnection], Optional[TCPConnection]] = (None, None)
+        self._reverse: Tuple[Optional[TCPConnection], Optional[TCPConnection]] = (None, None)
     
     def create_connection(self, client_port: int = 5000, 
                          server_port: int = 8000):
@@ -115,16 +223,20 @@ class TCPSimulator:
         self.server = TCPConnection(server_port, client_port, is_server=True,
                                     congestion_algorithm=self.congestion_algorithm)
         
+        self._port_label = {client_port: 'CLIENT', server_port: 'SERVER'}
+        self._port_conn = {client_port: self.client, server_port: self.server}
+        self._port_peer = {client_port: self.server, server_port: self.client}
+        self._forward = (self.client, self.server)
+        self._reverse = (self.server, self.client)
+        
         # 設置回調
-        self.client.on_state_change = self._on_state_change
-        self.client.on_packet_sent = self._on_packet_sent
-        self.client.on_packet_received = self._on_packet_received
+        if self.record_history:
+            for conn in (self.client, self.server):
+                conn.on_state_change = self._on_state_change
+                conn.on_packet_sent = self._on_packet_sent
+                conn.on_packet_received = self._on_packet_received
         self.client.on_metric_change = self._on_metric_change # 新增：綁定指標回調
         self.client.on_retransmit_needed = self._on_retransmit_needed # 新增：重傳回調
-        
-        self.server.on_state_change = self._on_state_change
-        self.server.on_packet_sent = self._on_packet_sent
-        self.server.on_packet_received = self._on_packet_received
         self.server.on_retransmit_needed = self._on_retransmit_needed # 新增：重傳回調
         
         # 添加到網路
@@ -132,55 +244,57 @@ class TCPSimulator:
         self.network.add_connection(self.server)
         
         # 設置網路回調
-        self.network.on_packet_transmitted = self._on_packet_transmitted
+        if self.record_history:
+            self.network.on_packet_transmitted = self._on_packet_transmitted
     
     def _on_state_change(self, old_state: TCPState, new_state: TCPState):
         """狀態改變回調"""
-        self.packet_history.append({
+        self._history_append({
             'type': 'STATE_CHANGE',
             'time': time.time(),
-            'old_state': old_state.value,
-            'new_state': new_state.value
+            'old_state': old_state.name,
+            'new_state': new_state.name
         })
     
     def _on_packet_sent(self, packet: TCPPacket):
         """資料包發送回調"""
-        self.packet_history.append({
+        self._history_append({
             'type': 'PACKET_SENT',
             'time': time.time(),
             'packet': packet,
-            'source': 'CLIENT' if packet.source_port == self.client.local_port else 'SERVER'
+            'source': self._port_label.get(packet.source_port, 'SERVER')
         })
     
     def _on_packet_received(self, packet: TCPPacket):
         """資料包接收回調"""
-        self.packet_history.append({
+        self._history_append({
             'type': 'PACKET_RECEIVED',
             'time': time.time(),
             'packet': packet,
-            'source': 'CLIENT' if packet.source_port == self.client.local_port else 'SERVER'
+            'source': self._port_label.get(packet.source_port, 'SERVER')
         })
     
     def _on_packet_transmitted(self, packet: TCPPacket, dest, status: str):
         """資料包傳輸回調"""
-        self.packet_history.append({
+        now = time.time()
+        self._history_append({
             'type': 'PACKET_TRANSMITTED',
-            'time': time.time(),
+            'time': now,
             'packet': packet,
             'status': status
         })
         # 丟包事件記錄到 metric_history，方便圖表標記
         if status == "LOST":
-            self.metric_history.append({
+            self._metric_append({
                 'type': 'EVENT',
                 'event': 'loss',
                 'seq': packet.seq_num,
-                'time': time.time()
+                'time': now
             })
         
-    def _on_metric_change(self, metric_name: str, value: float, timestamp: float):
-        """記錄指標變化"""
-        self.metric_history.append({
+    def _on_metric_change(self, metric_name: str, value: Any, timestamp: float):
+        """記錄指標變化（"cc" 的 value 為 (cwnd, ssthresh)，其餘事件為序列號）"""
+        self._metric_append({
             'type': 'METRIC',
             'metric': metric_name,
             'value': value,
@@ -189,13 +303,8 @@ class TCPSimulator:
     
     def _on_retransmit_needed(self, packet: TCPPacket):
         """處理快速重傳需求"""
-        # 確定發送方和接收方
-        if packet.source_port == self.client.local_port:
-            # 客戶端發送的包，重傳給伺服器
-            self.network.transmit_packet(packet, self.server)
-        else:
-            # 伺服器發送的包，重傳給客戶端
-            self.network.transmit_packet(packet, self.client)
+        # 重傳給來源埠的對端（客戶端的包給伺服器，其餘給客戶端）
+        self.network.transmit_packet(packet, self._port_peer.get(packet.source_port, self.client))
     
     def start_connection(self):
         """開始連接（三次握手）"""
@@ -208,76 +317,82 @@ class TCPSimulator:
     
     def send_data(self, data: bytes, from_client: bool = True):
         """發送資料"""
-        connection = self.client if from_client else self.server
+        connection, target = self._forward if from_client else self._reverse
         if not connection:
             return
         
         packet = connection.send_data(data)
         if packet:
-            target = self.server if from_client else self.client
             self.network.transmit_packet(packet, target)
     
     def close_connection(self, from_client: bool = True):
         """關閉連接（四次揮手）"""
-        connection = self.client if from_client else self.server
+        connection, target = self._forward if from_client else self._reverse
         if not connection:
             return
         
         packet = connection.close()
         if packet:
-            target = self.server if from_client else self.client
             self.network.transmit_packet(packet, target)
     
     def update(self):
         """更新模擬器"""
-        self.network.update()
-
-        def _route_target(item, fallback_client, fallback_server):
-            """依據封包/字典決定目的連接"""
-            packet = item['packet'] if isinstance(item, dict) else item
-            dest_port = item.get('dest') if isinstance(item, dict) else None
-            if dest_port is not None:
-                if self.server and dest_port == self.server.local_port:
-                    return self.server
-                if self.client and dest_port == self.client.local_port:
-                    return self.client
-            # 無 dest 時以封包 source_port 判斷方向
-            if self.client and packet.source_port == self.client.local_port:
-                return fallback_server
-            return fallback_client
+        # 本輪的傳輸共用一次時鐘讀取
+        now = time.time()
+        self.network.update(now)
         
-        # 檢查超時並處理重傳
-        if self.client:
-            retransmit_packets = self.client.check_timeouts()
-            for item in retransmit_packets:
-                packet = item['packet'] if isinstance(item, dict) else item
-                target = _route_target(item, self.client, self.server)
+        # 兩端依序：檢查超時並重傳，再依 cwnd pacing 發送緩衝資料
+        transmit = self.network.transmit_packet
+        route = self._route_target
+        for conn, peer in (self._forward, self._reverse):
+            if not conn:
+                continue
+            for item in conn.check_timeouts():
+                target = route(item)
                 if target:
-                    self.network.transmit_packet(packet, target)
-            # pacing 依 cwnd 發送緩衝資料
-            paced_list = self.client.drain_send_buffer()
-            for p in paced_list:
-                self.network.transmit_packet(p, self.server)
-        
-        if self.server:
-            retransmit_packets = self.server.check_timeouts()
-            for item in retransmit_packets:
-                packet = item['packet'] if isinstance(item, dict) else item
-                target = _route_target(item, self.server, self.client)
-                if target:
-                    self.network.transmit_packet(packet, target)
-            paced_list = self.server.drain_send_buffer()
-            for p in paced_list:
-                self.network.transmit_packet(p, self.client)
+                    transmit(item['packet'] if isinstance(item, dict) else item, target, now)
+            for p in conn.drain_send_buffer():
+                transmit(p, peer, now)
+    
+    def _route_target(self, item) -> Optional[TCPConnection]:
+        """依據封包/字典決定目的連接：優先用 dest 埠，沒有時送往來源埠的對端"""
+        if isinstance(item, dict):
+            dest_port = item.get('dest')
+            if dest_port is not None and dest_port in self._port_conn:
+                return self._port_conn[dest_port]
+            item = item['packet']
+        return self._port_peer.get(item.source_port)
+    
+    def next_event_time(self) -> Optional[float]:
+        """
+        下一個需要 update() 處理的事件時間（資料包到達、超時或 pacing 發送），沒有待辦事件時為 None
+        驅動端可據此排程下一次 update()，不必以固定間隔輪詢
+        """
+        times = [t for t in (self.network.next_arrival_time(),
+                             self.client.next_timer_time() if self.client else None,
+                             self.server.next_timer_time() if self.server else None)
+                 if t is not None]
+        return min(times) if times else None
     
-    def get_history(self) -> List[Dict]:
-        """獲取歷史記錄"""
-        return self.packet_history
+    def get_history(self, record_type: Optional[str] = None) -> List[Dict]:
+        """
+        獲取歷史記錄（依記錄順序的新列表）
+        record_type: 只取某一類型（HISTORY_TYPES 之一）
+        """
+        if record_type is None:
+            return list(self.packet_history)
+        if record_type not in HISTORY_TYPES:
+            raise ValueError(f"不支持的記錄類型: {record_type}. 支持的類型: {list(HISTORY_TYPES)}")
+        return [record for record in self.packet_history if record['type'] == record_type]
     
     def get_metric_history(self) -> List[Dict]:
         """獲取指標歷史記錄"""
         return self.metric_history
     
+    def metric_history_len(self) -> int:
+        """指標歷史的記錄數（不複製列表），供介面判斷是否有新資料"""
+        return len(self.metric_history)
+    
     def get_stats(self) -> Dict:
         """獲取統計資訊"""
         stats = {}